@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from .models import RegistrationKey
 
 User = get_user_model()
@@ -75,27 +76,32 @@ class CustomRegistrationForm(UserCreationForm):
         return email
 
     def save(self, commit=True):
+        # Пароль хешируется здесь, до транзакции: блокировка на запись не ждет PBKDF2
         user = super().save(commit=False)
         user.email = self.cleaned_data['email']
 
-        if commit:
-            user.save()
+        role = self.cleaned_data['role']
+        if role == 'admin':
+            user.is_superuser = True
+            user.is_staff = True
+        elif role == 'teacher':
+            user.is_staff = True
 
-            role = self.cleaned_data['role']
-            if role == 'admin':
-                user.is_superuser = True
-                user.is_staff = True
-            elif role == 'teacher':
-                user.is_staff = True
+        if commit:
+            with transaction.atomic():
+                # Ключ мог закончиться между clean() и save(): решает условный UPDATE,
+                # а пользователь создается только если использование засчитано
+                registration_key = self.cleaned_data.get('registration_key_obj')
+                if registration_key and not RegistrationKey.objects.consume(registration_key.key, role=role):
+                    raise forms.ValidationError(
+                        "Ключ уже использован максимальное число раз или больше не действует",
+                        code='key_exhausted',
+                    )
+                user.save()
 
-            user.save()
+        return user
 
-            registration_key = self.cleaned_data.get('registration_key_obj')
-            if registration_key:
-                registration_key.uses += 1
-                registration_key.save()
 
-        return user
 class CustomAuthenticationForm(AuthenticationForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -0,0 +1,65 @@
+import csv
+import hashlib
+
+from django.core.cache import cache
+
+CSV_FIELDS = ['key', 'role', 'expires_at', 'max_uses', 'note', 'created_at']
+
+LOOKUP_PREFIX = 'accounts:regkey'
+LOOKUP_TIMEOUT = 60
+MISSING_TIMEOUT = 30
+MISSING = 'missing'
+LOOKUP_FIELDS = ['role', 'is_active', 'expires_at', 'max_uses', 'uses']
+
+# Названия ролей в форме панели администратора -> значения RegistrationKey.role
+ROLE_MAPPING = {
+    'viewer': 'student',
+    'editor': 'teacher',
+    'admin': 'admin',
+}
+
+
+def write_csv(keys, fh):
+    # BOM — чтобы Excel открыл файл в UTF-8 и не испортил примечания на кириллице
+    fh.write('﻿')
+    writer = csv.writer(fh)
+    writer.writerow(CSV_FIELDS)
+    for key in keys:
+        writer.writerow([
+            key.key,
+            key.role,
+            key.expires_at.isoformat() if key.expires_at else '',
+            key.max_uses,
+            key.note or '',
+            key.created_at.isoformat(),
+        ])
+
+
+def csv_filename(count, now):
+    return f'registration-keys-{count}-{now:%Y%m%d-%H%M%S}.csv'
+
+
+def _lookup_key(value):
+    # В кеше — только хеш ключа: значение ключа не должно лежать в чужом хранилище открытым
+    return f'{LOOKUP_PREFIX}:{hashlib.sha256(value.encode("utf-8")).hexdigest()}'
+
+
+def lookup(value):
+    """Поля ключа для проверки на странице регистрации или None, если ключа нет.
+
+    Результат кешируется и для найденных, и для несуществующих ключей — перебор
+    не доходит до базы. Срок действия сверяется при каждом вызове, а кеш
+    сбрасывает invalidate() при использовании, отзыве или изменении ключа.
+    """
+    from .models import RegistrationKey
+
+    cache_key = _lookup_key(value)
+    data = cache.get(cache_key)
+    if data is None:
+        data = RegistrationKey.objects.filter(key=value).values(*LOOKUP_FIELDS).first()
+        cache.set(cache_key, data or MISSING, LOOKUP_TIMEOUT if data else MISSING_TIMEOUT)
+    return None if data == MISSING else data
+
+
+def invalidate(*values):
+    cache.delete_many([_lookup_key(value) for value in values])
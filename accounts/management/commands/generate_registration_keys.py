@@ -0,0 +1,48 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.keys import write_csv
+from accounts.models import RegistrationKey
+
+
+class Command(BaseCommand):
+    help = 'Создает пакет ключей регистрации одним запросом и выводит их в CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int)
+        parser.add_argument('--role', choices=[role for role, _ in RegistrationKey.ROLE_CHOICES], default='student')
+        parser.add_argument('--expiry-days', type=int, default=30, help='0 — без ограничения срока')
+        parser.add_argument('--max-uses', type=int, default=1, help='0 — без ограничения')
+        parser.add_argument('--note', default='')
+        parser.add_argument('--created-by', help='Имя пользователя-автора; по умолчанию первый суперпользователь')
+        parser.add_argument('--output', help='Файл для записи; по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects
+        if options['created_by']:
+            creator = users.filter(username=options['created_by']).first()
+        else:
+            creator = users.filter(is_superuser=True).order_by('pk').first()
+        if creator is None:
+            raise CommandError('Автор ключей не найден')
+
+        try:
+            keys = RegistrationKey.create_batch(
+                created_by=creator,
+                count=options['count'],
+                role=options['role'],
+                expiry_days=options['expiry_days'],
+                max_uses=options['max_uses'],
+                note=options['note'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as fh:
+                write_csv(keys, fh)
+            self.stderr.write(self.style.SUCCESS(f"Создано ключей: {len(keys)}, файл {options['output']}"))
+        else:
+            write_csv(keys, sys.stdout)
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user, get_user_model
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from library.cache_versions import get_versions, is_shared_cache, model_key
+
+USER_CACHE_PREFIX = 'accounts:user'
+# Верхняя граница жизни устаревшей записи, если сброс версии где-то потерялся
+# (update() без сигналов, недоступный кеш): блокировка или снятие прав подействуют не позже
+USER_CACHE_TIMEOUT = 60
+
+
+def _cache_key(user_pk, version):
+    return f'{USER_CACHE_PREFIX}:{user_pk}:{version}'
+
+
+def _cached_user(request):
+    if not is_shared_cache():
+        # Сброс версии в LocMemCache виден только процессу, который изменил пользователя:
+        # остальные продолжили бы пускать заблокированного или разжалованного
+        return None
+    session = request.session
+    user_pk = session.get(SESSION_KEY)
+    if user_pk is None or session.get(BACKEND_SESSION_KEY) not in settings.AUTHENTICATION_BACKENDS:
+        return None
+    # Версия пользователя меняется при любом сохранении или удалении (accounts/signals.py),
+    # поэтому устаревшая запись просто перестает находиться
+    version = get_versions([model_key(get_user_model(), user_pk)])[0]
+    key = _cache_key(user_pk, version)
+    user = cache.get(key)
+    if user is None:
+        user = get_user(request)
+        if user.is_authenticated:
+            cache.set(key, user, USER_CACHE_TIMEOUT)
+        return user
+    # Те же проверки, что в django.contrib.auth.get_user(): при смене пароля
+    # хеш сессии перестает совпадать, и решение оставляем полной проверке
+    session_hash = session.get(HASH_SESSION_KEY)
+    if not user.is_active or not session_hash or not constant_time_compare(
+        session_hash, user.get_session_auth_hash()
+    ):
+        return get_user(request)
+    return user
+
+
+def get_cached_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = _cached_user(request) or get_user(request)
+    return request._cached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware, который берет пользователя сессии из кеша.
+
+    Стандартный middleware на каждом запросе авторизованного пользователя
+    делает SELECT по accounts_customuser. Здесь объект хранится в кеше под
+    ключом с версией пользователя; любое сохранение пользователя (профиль,
+    панель администратора, админка, last_login при входе) версию сбрасывает.
+    Кеш используется, только если он общий для всех процессов (не LocMemCache).
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_cached_user(request))
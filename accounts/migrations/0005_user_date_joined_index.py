@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_customuser_bio_customuser_profile_picture_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['-date_joined', '-id'], name='accounts_user_joined_idx'),
+        ),
+    ]
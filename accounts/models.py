@@ -1,13 +1,15 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.contrib.auth.models import User
 import secrets
 import string
 from django.utils import timezone
 from datetime import timedelta
 
+from .keys import invalidate
+
 class CustomUser(AbstractUser):
     ROLE_CHOICES = [
         ('student', 'Студент'),
@@ -37,6 +39,36 @@ class CustomUser(AbstractUser):
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
+        indexes = [
+            # Сортировка по умолчанию в таблице пользователей панели администратора
+            models.Index(fields=['-date_joined', '-id'], name='accounts_user_joined_idx'),
+        ]
+
+
+class RegistrationKeyQuerySet(models.QuerySet):
+    def usable(self, now=None):
+        now = now or timezone.now()
+        return self.filter(
+            Q(expires_at__isnull=True) | Q(expires_at__gt=now),
+            Q(max_uses__lte=0) | Q(uses__lt=F('max_uses')),
+            is_active=True,
+        )
+
+    def consume(self, key, role=None):
+        """Атомарно засчитывает одно использование ключа. Возвращает True, если удалось.
+
+        Проверка и увеличение счетчика — один UPDATE ... SET uses = uses + 1
+        WHERE uses < max_uses AND is_active AND не истек: при одновременных
+        регистрациях по одному ключу база сама не даст превысить max_uses,
+        а блокировка на запись держится только на время этого запроса.
+        """
+        keys = self.usable().filter(key=key)
+        if role is not None:
+            keys = keys.filter(role=role)
+        consumed = keys.update(uses=F('uses') + 1) == 1
+        # И при отказе: кеш мог еще считать исчерпанный ключ действительным
+        invalidate(key)
+        return consumed
 
 
 class RegistrationKey(models.Model):
@@ -62,14 +94,43 @@ class RegistrationKey(models.Model):
     note = models.TextField(blank=True, null=True)
     is_active = models.BooleanField(default=True)
 
-    def generate_key(self, length=32):
-        alphabet = string.ascii_letters + string.digits
-        return ''.join(secrets.choice(alphabet) for _ in range(length))
+    KEY_ALPHABET = string.ascii_letters + string.digits
+    KEY_LENGTH = 32
+    BATCH_MAX = 1000
+
+    @classmethod
+    def generate_key(cls, length=KEY_LENGTH):
+        return ''.join(secrets.choice(cls.KEY_ALPHABET) for _ in range(length))
+
+    @classmethod
+    def create_batch(cls, created_by, count, role='student', expiry_days=0, max_uses=1, note=''):
+        """Создает count ключей одним bulk_create в одной транзакции."""
+        if not 1 <= count <= cls.BATCH_MAX:
+            raise ValueError(f'Количество ключей должно быть от 1 до {cls.BATCH_MAX}')
+        now = timezone.now()
+        expires_at = now + timedelta(days=expiry_days) if expiry_days > 0 else None
+        keys = [
+            cls(
+                key=cls.generate_key(), role=role, created_by=created_by,
+                expires_at=expires_at, max_uses=max_uses, note=note,
+            )
+            for _ in range(count)
+        ]
+        with transaction.atomic():
+            created = cls.objects.bulk_create(keys)
+        invalidate(*[key.key for key in created])
+        return created
 
     def save(self, *args, **kwargs):
         if not self.key:
             self.key = self.generate_key()
         super().save(*args, **kwargs)
+        invalidate(self.key)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        invalidate(self.key)
+        return result
 
     def __str__(self):
         return f"{self.key[:12]}... ({self.role})"
@@ -86,12 +147,14 @@ class RegistrationKey(models.Model):
 
         return True, "Ключ действителен"
 
+    objects = RegistrationKeyQuerySet.as_manager()
+
     def use_key(self):
-        if self.is_valid()[0]:
-            self.uses += 1
-            self.save()
-            return True
-        return False
+        # uses += 1 через чтение и save() терял бы увеличения при параллельных регистрациях
+        if not RegistrationKey.objects.consume(self.key):
+            return False
+        self.refresh_from_db(fields=['uses'])
+        return True
 
     class Meta:
         verbose_name = 'Ключ регистрации'
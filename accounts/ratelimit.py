@@ -0,0 +1,99 @@
+import hashlib
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.shortcuts import render
+
+CACHE_PREFIX = 'accounts:ratelimit'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+
+
+def parse_rate(rate):
+    """'30/m' -> (30, 60): число запросов и период в секундах."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period]
+
+
+def client_ip(request):
+    # За обратным прокси REMOTE_ADDR — адрес самого прокси. Доверяем X-Forwarded-For
+    # только на RATELIMIT_PROXY_COUNT последних звеньев: первые клиент может подделать
+    proxies = getattr(settings, 'RATELIMIT_PROXY_COUNT', 0)
+    if proxies:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class TokenBucket:
+    """Ведро токенов в кеше: capacity запросов подряд, затем rate в секунду.
+
+    Состояние — пара (токены, время) под одним ключом. get/set не атомарны,
+    поэтому при гонке пачка запросов может пройти на пару штук больше лимита;
+    для отсечения перебора это не важно, а запрос к кешу остается один на чтение.
+    """
+
+    def __init__(self, scope, rate, burst=None):
+        count, period = parse_rate(rate)
+        self.scope = scope
+        self.rate = count / period
+        self.capacity = burst or count
+        # Полностью восстановившееся ведро хранить незачем — ключ истекает сам
+        self.timeout = math.ceil(self.capacity / self.rate) + 1
+
+    def _key(self, identity):
+        digest = hashlib.sha256(identity.encode('utf-8')).hexdigest()[:32]
+        return f'{CACHE_PREFIX}:{self.scope}:{digest}'
+
+    def consume(self, identity, cost=1):
+        """Списывает cost токенов. Возвращает (разрешено, через сколько секунд повторить)."""
+        key = self._key(identity)
+        now = time.time()
+        tokens, updated = cache.get(key) or (self.capacity, now)
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if tokens < cost:
+            return False, math.ceil((cost - tokens) / self.rate)
+        cache.set(key, (tokens - cost, now), self.timeout)
+        return True, 0
+
+
+def ratelimit(scope, rate, burst=None, methods=('POST',), json=False):
+    """Ограничивает частоту запросов с одного IP к view по алгоритму token bucket.
+
+    Срабатывает до тела view, то есть до запросов к базе и хеширования пароля.
+    Лимит можно переопределить в settings.RATELIMIT_RATES[scope]; при
+    RATELIMIT_ENABLED = False проверка отключается.
+        @ratelimit('login', '10/m')
+        def login_view(request): ...
+    """
+    def decorator(view):
+        buckets = {}
+
+        def bucket():
+            current = getattr(settings, 'RATELIMIT_RATES', {}).get(scope, rate)
+            if current not in buckets:
+                buckets[current] = TokenBucket(scope, current, burst)
+            return buckets[current]
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not getattr(settings, 'RATELIMIT_ENABLED', True) or request.method not in methods:
+                return view(request, *args, **kwargs)
+            allowed, retry_after = bucket().consume(client_ip(request))
+            if allowed:
+                return view(request, *args, **kwargs)
+            message = 'Слишком много запросов. Попробуйте позже.'
+            if json:
+                response = JsonResponse({'success': False, 'valid': False, 'error': message, 'message': message},
+                                        status=429)
+            else:
+                response = render(request, 'accounts/rate_limited.html',
+                                  {'message': message, 'retry_after': retry_after}, status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,18 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from library.cache_versions import bump
+
+
+@receiver(post_save, sender=get_user_model())
+def user_saved(sender, instance, raw=False, **kwargs):
+    # Сбрасывает закешированного пользователя сессии (accounts/middleware.py)
+    # и фрагменты карточек его материалов, где выводится имя автора
+    if not raw:
+        bump(instance)
+
+
+@receiver(post_delete, sender=get_user_model())
+def user_deleted(sender, instance, **kwargs):
+    bump(instance)
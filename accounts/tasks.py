@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from library.jobs import task
+from library.models import Resource
+
+DELETE_BATCH_SIZE = 500
+
+
+@task('accounts.delete_user')
+def delete_user(user_id):
+    user = get_user_model().objects.filter(pk=user_id, is_superuser=False).first()
+    if user is None:
+        return
+    # Материалы удаляются пачками в отдельных транзакциях: каскад с сигналами по
+    # тысячам строк в одной транзакции надолго заблокировал бы запись в SQLite.
+    # После сбоя повтор продолжит с оставшихся
+    resources = Resource.objects.filter(author_id=user_id).order_by('pk').values_list('pk', flat=True)
+    while True:
+        batch = list(resources[:DELETE_BATCH_SIZE])
+        if not batch:
+            break
+        with transaction.atomic():
+            Resource.objects.filter(pk__in=batch).delete()
+    user.delete()
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from .models import RegistrationKey
+
+
+class LoginRouteTests(TestCase):
+    def setUp(self):
+        get_user_model().objects.create_user('reader', password='password')
+
+    def test_old_login_url_redirects_without_checking_password(self):
+        response = self.client.post('/login/?next=/profile/', {'username': 'reader', 'password': 'password'})
+        self.assertRedirects(response, f"{reverse('login')}?next=/profile/", status_code=301,
+                             fetch_redirect_response=False)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+
+class RegistrationKeyConcurrencyTests(TransactionTestCase):
+    THREADS = 8
+    ATTEMPTS = 10
+    MAX_USES = 25
+
+    def test_concurrent_consume_never_exceeds_max_uses(self):
+        creator = get_user_model().objects.create_user('admin', password='password')
+        key = RegistrationKey.objects.create(created_by=creator, max_uses=self.MAX_USES)
+        outcomes = []
+        lock = threading.Lock()
+        # Все потоки стартуют одновременно — иначе первые израсходуют ключ до старта последних
+        barrier = threading.Barrier(self.THREADS)
+
+        def consume():
+            # SQLite отвечает «database is locked», пока пишет другой поток, — повторяем,
+            # чтобы каждая попытка получила ответ: засчитано или отказано
+            while True:
+                try:
+                    return RegistrationKey.objects.consume(key.key)
+                except OperationalError:
+                    time.sleep(0.001)
+
+        def hammer():
+            barrier.wait()
+            try:
+                for _ in range(self.ATTEMPTS):
+                    consumed = consume()
+                    with lock:
+                        outcomes.append(consumed)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=hammer) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        key.refresh_from_db(fields=['uses'])
+        self.assertEqual(len(outcomes), self.THREADS * self.ATTEMPTS)
+        self.assertEqual(outcomes.count(True), self.MAX_USES)
+        self.assertEqual(key.uses, self.MAX_USES)
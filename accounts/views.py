@@ -3,17 +3,25 @@ import string
 from datetime import timedelta
 import json
 
+from django import forms
 from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate, get_user_model, logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.core.paginator import Paginator
+from django.db.models import Count, Q
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
 from .forms import CustomRegistrationForm, CustomAuthenticationForm
+from .keys import ROLE_MAPPING, csv_filename, lookup as lookup_key, write_csv
 from .models import RegistrationKey
+from .ratelimit import ratelimit
+from library import jobs
+from library.cache_versions import bump
 from library.models import Resource, Bookmark, Rating
 
 User = get_user_model()
@@ -23,12 +31,19 @@ def is_superuser(user):
     return user.is_superuser
 
 
+@ratelimit('register', '5/m', burst=10)
 def register_view(request):
     if request.method == 'POST':
         form = CustomRegistrationForm(request.POST)
 
         if form.is_valid():
-            user = form.save()
+            try:
+                user = form.save()
+            except forms.ValidationError as exc:
+                form.add_error('registration_key', exc)
+                for error in exc.messages:
+                    messages.error(request, error)
+                return render(request, 'accounts/register.html', {'form': form})
 
             username = form.cleaned_data.get('username')
             password = form.cleaned_data.get('password1')
@@ -54,6 +69,7 @@ def register_view(request):
     return render(request, 'accounts/register.html', {'form': form})
 
 
+@ratelimit('login', '10/m')
 def login_view(request):
     if request.method == 'POST':
         form = CustomAuthenticationForm(request, data=request.POST)
@@ -85,9 +101,9 @@ def logout_view(request):
 
 @login_required
 def profile_view(request):
-    user_resources = Resource.objects.filter(author=request.user)
-    user_bookmarks = Bookmark.objects.filter(user=request.user)
-    user_ratings = Rating.objects.filter(user=request.user)
+    user_resources = Resource.objects.for_cards().filter(author=request.user)
+    user_bookmarks = Bookmark.objects.filter(user=request.user).select_related('resource')
+    user_ratings = Rating.objects.filter(user=request.user).select_related('resource')
 
     context = {
         'user_resources': user_resources,
@@ -104,7 +120,20 @@ def edit_profile(request):
         user.email = request.POST.get('email', user.email)
         user.first_name = request.POST.get('first_name', user.first_name)
         user.last_name = request.POST.get('last_name', user.last_name)
+        picture = request.FILES.get('profile_picture')
+        old_picture = user.profile_picture.name if user.profile_picture else None
+        if picture:
+            try:
+                # Проверка через ImageField: Pillow должен открыть файл как картинку
+                user.profile_picture = forms.ImageField().clean(picture)
+            except forms.ValidationError as exc:
+                messages.error(request, ' '.join(exc.messages))
+                return render(request, 'accounts/edit_profile.html')
         user.save()
+        if picture:
+            if old_picture and old_picture != user.profile_picture.name:
+                jobs.enqueue('library.delete_media', args=[old_picture])
+            jobs.enqueue('library.generate_thumbnails', args=[user.profile_picture.name])
         messages.success(request, 'Профиль обновлен!')
         return redirect('profile')
 
@@ -115,26 +144,104 @@ def is_admin(user):
     return user.is_superuser or user.is_staff
 
 
+USERS_PAGE_SIZE = 25
+USERS_MAX_PAGE_SIZE = 100
+# Допустимые значения параметра sort: пользовательский ввод не попадает в order_by напрямую
+USERS_SORT_FIELDS = {
+    'id': 'pk',
+    'username': 'username',
+    'email': 'email',
+    'name': 'last_name',
+    'date_joined': 'date_joined',
+}
+USERS_ROLE_FILTERS = {
+    'admin': Q(is_superuser=True),
+    'editor': Q(is_staff=True, is_superuser=False),
+    'user': Q(is_staff=False, is_superuser=False),
+}
+
+
 @login_required
 @user_passes_test(is_superuser)
 def admin_dashboard(request):
-    total_users = User.objects.count()
-    admins = User.objects.filter(is_superuser=True).count()
-    teachers = User.objects.filter(is_staff=True, is_superuser=False).count()
-    students = total_users - admins - teachers
-
+    # Одна агрегация с условными COUNT вместо отдельного запроса на каждую цифру
+    stats = User.objects.aggregate(
+        total_users=Count('pk'),
+        admins=Count('pk', filter=Q(is_superuser=True)),
+        teachers=Count('pk', filter=Q(is_staff=True, is_superuser=False)),
+    )
+    stats['students'] = stats['total_users'] - stats['admins'] - stats['teachers']
+
+    # Сама таблица пользователей загружается постранично через admin_users_api
     context = {
-        'stats': {
-            'total_users': total_users,
-            'admins': admins,
-            'teachers': teachers,
-            'students': students,
-        },
-        'users': User.objects.all().order_by('-date_joined')
+        'stats': stats,
+        'page_size': USERS_PAGE_SIZE,
     }
     return render(request, 'accounts/admin_dashboard.html', context)
 
 
+def _int_param(request, name, default, minimum, maximum):
+    try:
+        value = int(request.GET.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(minimum, min(value, maximum))
+
+
+@login_required
+@user_passes_test(is_superuser)
+def admin_users_api(request):
+    users = User.objects.only(
+        'pk', 'username', 'email', 'first_name', 'last_name',
+        'is_superuser', 'is_staff', 'is_active', 'date_joined',
+    )
+
+    query = request.GET.get('q', '').strip()
+    if query:
+        users = users.filter(
+            Q(username__icontains=query) | Q(email__icontains=query)
+            | Q(first_name__icontains=query) | Q(last_name__icontains=query)
+        )
+    role = request.GET.get('role')
+    if role in USERS_ROLE_FILTERS:
+        users = users.filter(USERS_ROLE_FILTERS[role])
+
+    sort = request.GET.get('sort', 'date_joined')
+    if sort not in USERS_SORT_FIELDS:
+        sort = 'date_joined'
+    direction = 'asc' if request.GET.get('dir') == 'asc' else 'desc'
+    prefix = '' if direction == 'asc' else '-'
+    # pk вторым ключом: при равных значениях порядок страниц не должен «плавать»
+    users = users.order_by(f'{prefix}{USERS_SORT_FIELDS[sort]}', f'{prefix}pk')
+
+    page_size = _int_param(request, 'page_size', USERS_PAGE_SIZE, 1, USERS_MAX_PAGE_SIZE)
+    page = Paginator(users, page_size).get_page(request.GET.get('page'))
+
+    return JsonResponse({
+        'success': True,
+        'users': [
+            {
+                'id': user.pk,
+                'username': user.username,
+                'email': user.email,
+                'full_name': user.get_full_name(),
+                'is_superuser': user.is_superuser,
+                'is_staff': user.is_staff,
+                'is_active': user.is_active,
+                'date_joined': user.date_joined.isoformat(),
+                'can_delete': not user.is_superuser and user.pk != request.user.pk,
+            }
+            for user in page.object_list
+        ],
+        'page': page.number,
+        'num_pages': page.paginator.num_pages,
+        'total': page.paginator.count,
+        'page_size': page_size,
+        'sort': sort,
+        'dir': direction,
+    })
+
+
 @login_required
 @user_passes_test(is_superuser)
 def delete_user(request, user_id):
@@ -153,12 +260,16 @@ def delete_user(request, user_id):
                     'error': 'Нельзя удалить администратора'
                 })
 
-            username = user.username
-            user.delete()
+            # Каскад по материалам и оценкам долгий: блокируем вход сразу, а сами
+            # записи удаляет фоновая задача
+            User.objects.filter(pk=user.pk).update(is_active=False)
+            # update() не шлет post_save — сбрасываем закешированного пользователя сами
+            bump(user)
+            jobs.enqueue('accounts.delete_user', args=[user.pk], priority=jobs.PRIORITY_HIGH)
 
             return JsonResponse({
                 'success': True,
-                'message': f'Пользователь {username} удален'
+                'message': f'Пользователь {user.username} удален'
             })
 
         except User.DoesNotExist:
@@ -220,30 +331,22 @@ def generate_registration_key(request):
     try:
         data = json.loads(request.body)
 
-        role_mapping = {
-            'viewer': 'student',
-            'editor': 'teacher',
-            'admin': 'admin',
-        }
-
         frontend_role = data.get('role', 'viewer')
-        backend_role = role_mapping.get(frontend_role, frontend_role)
+        backend_role = ROLE_MAPPING.get(frontend_role, frontend_role)
 
         expiry_days = int(data.get('expiry_days', 7))
         max_uses = int(data.get('max_uses', 1))
         note = data.get('note', '')
 
+        # Срок задаем сразу, чтобы ключ записывался одним INSERT без второго UPDATE
         key = RegistrationKey.objects.create(
             created_by=request.user,
             role=backend_role,
             max_uses=max_uses,
-            note=note
+            note=note,
+            expires_at=timezone.now() + timedelta(days=expiry_days) if expiry_days > 0 else None,
         )
 
-        if expiry_days > 0:
-            key.expires_at = timezone.now() + timedelta(days=expiry_days)
-            key.save()
-
         return JsonResponse({
             'success': True,
             'key': {
@@ -262,6 +365,35 @@ def generate_registration_key(request):
         return JsonResponse({'success': False, 'error': str(e)}, status=400)
 
 
+@login_required
+@user_passes_test(is_admin)
+@require_POST
+def generate_registration_keys_bulk(request):
+    frontend_role = request.POST.get('role', 'viewer')
+    role = ROLE_MAPPING.get(frontend_role, frontend_role)
+    if role not in dict(RegistrationKey.ROLE_CHOICES):
+        return JsonResponse({'success': False, 'error': 'Некорректная роль'}, status=400)
+    try:
+        count = int(request.POST.get('count', 1))
+        expiry_days = int(request.POST.get('expiry_days', 7))
+        max_uses = int(request.POST.get('max_uses', 1))
+        keys = RegistrationKey.create_batch(
+            created_by=request.user,
+            count=count,
+            role=role,
+            expiry_days=expiry_days,
+            max_uses=max_uses,
+            note=request.POST.get('note', ''),
+        )
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    response = HttpResponse(content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{csv_filename(len(keys), timezone.localtime())}"'
+    write_csv(keys, response)
+    return response
+
+
 @login_required
 @user_passes_test(is_admin)
 def get_active_keys(request):
@@ -314,6 +446,7 @@ def revoke_key(request, key_id):
 
 
 @csrf_exempt
+@ratelimit('check_registration_key', '30/m', burst=20, methods=('GET',), json=True)
 def check_registration_key(request):
     if request.method == 'GET':
         key_value = request.GET.get('key', '').strip()
@@ -321,37 +454,36 @@ def check_registration_key(request):
         if not key_value:
             return JsonResponse({'valid': False, 'message': 'Введите ключ'})
 
-        try:
-            key = RegistrationKey.objects.get(key=key_value)
-
-            if not key.is_active:
-                return JsonResponse({
-                    'valid': False,
-                    'message': 'Ключ неактивен'
-                })
+        # Поля ключа из кеша: страница дергает проверку на каждый ввод символа
+        key = lookup_key(key_value)
+        if key is None:
+            return JsonResponse({'valid': False, 'message': 'Ключ не найден'})
 
-            if key.expires_at and timezone.now() > key.expires_at:
-                return JsonResponse({
-                    'valid': False,
-                    'message': 'Срок действия ключа истек'
-                })
+        if not key['is_active']:
+            return JsonResponse({
+                'valid': False,
+                'message': 'Ключ неактивен'
+            })
 
-            if key.max_uses > 0 and key.uses >= key.max_uses:
-                return JsonResponse({
-                    'valid': False,
-                    'message': 'Ключ использован максимальное число раз'
-                })
+        if key['expires_at'] and timezone.now() > key['expires_at']:
+            return JsonResponse({
+                'valid': False,
+                'message': 'Срок действия ключа истек'
+            })
 
+        if key['max_uses'] > 0 and key['uses'] >= key['max_uses']:
             return JsonResponse({
-                'valid': True,
-                'message': 'Ключ действителен',
-                'role': key.role,
-                'role_name': key.get_role_display(),
-                'expires_at': key.expires_at.isoformat() if key.expires_at else None,
-                'uses_left': key.max_uses - key.uses if key.max_uses > 0 else '∞'
+                'valid': False,
+                'message': 'Ключ использован максимальное число раз'
             })
 
-        except RegistrationKey.DoesNotExist:
-            return JsonResponse({'valid': False, 'message': 'Ключ не найден'})
+        return JsonResponse({
+            'valid': True,
+            'message': 'Ключ действителен',
+            'role': key['role'],
+            'role_name': dict(RegistrationKey.ROLE_CHOICES).get(key['role'], key['role']),
+            'expires_at': key['expires_at'].isoformat() if key['expires_at'] else None,
+            'uses_left': key['max_uses'] - key['uses'] if key['max_uses'] > 0 else '∞'
+        })
 
     return JsonResponse({'valid': False, 'message': 'Неверный метод запроса'})
\ No newline at end of file
@@ -1,7 +1,37 @@
+import logging
 import os
 
+from asgiref.sync import sync_to_async
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'knowledge_library.settings')
+os.environ.setdefault('KNOWLEDGE_LIBRARY_ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+logger = logging.getLogger(__name__)
+
+
+async def lifespan(receive, send):
+    # Django не обрабатывает lifespan сам: прогреваем кеши фрагментов при старте сервера,
+    # чтобы первые посетители не платили за холодный кеш
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            from library.cache_warmup import warm_caches
+            try:
+                pages = await sync_to_async(warm_caches)()
+                logger.info('Кеш прогрет: %d страниц', pages)
+            except Exception:
+                logger.exception('Не удалось прогреть кеш при старте')
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    else:
+        await django_application(scope, receive, send)
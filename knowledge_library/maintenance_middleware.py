@@ -1,22 +1,59 @@
 import os
+import time
+from datetime import datetime
 from pathlib import Path
+
+from django.conf import settings
 from django.http import HttpResponse
-from django.utils import timezone
+
+ALLOWED_PATHS = ('/accounts/login/', '/accounts/logout/', '/login/', '/logout/')
 
 
 class MaintenanceModeMiddleware:
+    """Показывает страницу обслуживания, пока существует maintenance.lock.
+
+    Состояние файла проверяется не чаще раза в MAINTENANCE_CHECK_INTERVAL
+    секунд — первым запросом после истечения интервала, остальные stat() не
+    делают. Страница 503 рендерится один раз при смене состояния и отдается
+    готовыми байтами.
+    """
 
     def __init__(self, get_response):
         self.get_response = get_response
         project_root = Path(__file__).parent.parent
         self.lock_file = project_root / 'maintenance.lock'
+        self.check_interval = getattr(settings, 'MAINTENANCE_CHECK_INTERVAL', 2)
+        self.retry_after = str(getattr(settings, 'MAINTENANCE_RETRY_AFTER', 1800))
+
+        self.enabled = False
+        self.body = b''
+        self._mtime = None
+        self._refresh()
+
+    def _refresh(self):
+        self._next_check = time.monotonic() + self.check_interval
+        try:
+            mtime = os.stat(self.lock_file).st_mtime
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime == self._mtime:
+            return
+        if mtime is not None:
+            file_time = datetime.fromtimestamp(mtime).strftime('%d.%m.%Y %H:%M')
+            self.body = self.render_maintenance_page(file_time).encode('utf-8')
+        self._mtime = mtime
+        self.enabled = mtime is not None
 
     def __call__(self, request):
-        if self.lock_file.exists():
+        # Гонка двух запросов здесь безобидна: оба прочитают один и тот же файл
+        if time.monotonic() >= self._next_check:
+            self._refresh()
+        if self.enabled:
             if request.path.startswith('/admin/'):
                 return self.get_response(request)
 
-            if request.path in ['/accounts/login/', '/accounts/logout/', '/login/', '/logout/']:
+            if request.path in ALLOWED_PATHS:
                 return self.get_response(request)
 
             return self.get_maintenance_response(request)
@@ -24,13 +61,13 @@ class MaintenanceModeMiddleware:
         return self.get_response(request)
 
     def get_maintenance_response(self, request):
+        response = HttpResponse(self.body, status=503, content_type='text/html; charset=utf-8')
+        response['Retry-After'] = self.retry_after
+        response['Cache-Control'] = 'no-store'
+        return response
 
-        file_time = ""
-        if self.lock_file.exists():
-            mtime = self.lock_file.stat().st_mtime
-            from datetime import datetime
-            file_time = datetime.fromtimestamp(mtime).strftime('%d.%m.%Y %H:%M')
-
+    @staticmethod
+    def render_maintenance_page(file_time):
         html = f"""
         <!DOCTYPE html>
         <html lang="ru">
@@ -218,4 +255,4 @@ class MaintenanceModeMiddleware:
         </html>
         """
 
-        return HttpResponse(html, status=503, content_type='text/html')
\ No newline at end of file
+        return html
\ No newline at end of file
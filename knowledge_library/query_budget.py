@@ -0,0 +1,156 @@
+import logging
+import re
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.shortcuts import render
+
+logger = logging.getLogger('knowledge_library.queries')
+
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+THIS_FILE = str(Path(__file__).resolve())
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\bIN \((?:\s*(?:\?|%s)\s*,?)+\)', re.IGNORECASE)
+PARAM_RE = re.compile(r'%s')
+SPACE_RE = re.compile(r'\s+')
+
+_reports = deque(maxlen=getattr(settings, 'QUERY_BUDGET_REPORT_SIZE', 200))
+_reports_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def normalize_sql(sql):
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = PARAM_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def _call_site():
+    for frame in reversed(traceback.extract_stack()):
+        filename = frame.filename
+        if filename == THIS_FILE or not filename.startswith(PROJECT_ROOT):
+            continue
+        if 'site-packages' in filename:
+            continue
+        return f'{Path(filename).relative_to(PROJECT_ROOT)}:{frame.lineno} ({frame.name})'
+    return '?'
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'shape': normalize_sql(sql),
+                'site': _call_site(),
+                'duration': time.perf_counter() - start,
+            })
+
+    def groups(self):
+        counter = Counter((query['shape'], query['site']) for query in self.queries)
+        return [
+            {'shape': shape, 'site': site, 'count': count}
+            for (shape, site), count in counter.most_common()
+        ]
+
+    def repeated(self, threshold):
+        return [group for group in self.groups() if group['count'] >= threshold]
+
+
+class QueryBudgetMiddleware:
+    """Считает SQL-запросы каждого запроса и ищет N+1.
+
+    Бюджеты задаются в settings.QUERY_BUDGETS по имени URL, например
+    {'resource_list': 6}. Итог пишется в заголовок X-Query-Count, в лог
+    knowledge_library.queries и в отчет /query-report/ для персонала.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Выключенный учет убирается из цепочки целиком: синхронный middleware
+        # заставил бы ASGI-обработчик выполнять асинхронные представления в потоке
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        self.default_budget = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+        self.n_plus_one_threshold = getattr(settings, 'QUERY_BUDGET_N_PLUS_ONE_THRESHOLD', 5)
+        self.strict = getattr(settings, 'QUERY_BUDGET_STRICT', False)
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        wrappers = [connections[alias].execute_wrapper(recorder) for alias in connections]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        try:
+            response = self.get_response(request)
+            # Шаблонные ответы рендерятся лениво — запросы из шаблона тоже должны попасть в отчет
+            if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+                response.render()
+        finally:
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+
+        view_name = request.resolver_match.url_name if request.resolver_match else None
+        budget = self.budgets.get(view_name, self.default_budget)
+        total = len(recorder.queries)
+        suspects = recorder.repeated(self.n_plus_one_threshold)
+        over_budget = budget is not None and total > budget
+
+        header = f'{total}'
+        if budget is not None:
+            header += f'; budget={budget}'
+        if suspects:
+            header += f'; n+1={len(suspects)}'
+        response['X-Query-Count'] = header
+
+        level = logging.WARNING if over_budget or suspects else logging.DEBUG
+        logger.log(
+            level, '%s %s view=%s queries=%d budget=%s n+1=%d',
+            request.method, request.path, view_name, total, budget, len(suspects)
+        )
+        for suspect in suspects:
+            logger.log(level, '  N+1: %dx at %s: %s', suspect['count'], suspect['site'], suspect['shape'][:200])
+
+        with _reports_lock:
+            _reports.appendleft({
+                'method': request.method,
+                'path': request.path,
+                'view': view_name,
+                'total': total,
+                'budget': budget,
+                'over_budget': over_budget,
+                'duration': sum(query['duration'] for query in recorder.queries),
+                'suspects': suspects,
+                'groups': recorder.groups()[:20],
+            })
+
+        if over_budget and self.strict:
+            raise QueryBudgetExceeded(f'{view_name}: {total} запросов при бюджете {budget}')
+
+        return response
+
+
+@staff_member_required
+def query_report(request):
+    with _reports_lock:
+        reports = list(_reports)
+    return render(request, 'query_report.html', {'reports': reports})
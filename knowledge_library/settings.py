@@ -9,6 +9,9 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# Асинхронные страницы чтения (library/async_views.py); включается в asgi.py
+ASYNC_READ_VIEWS = os.environ.get('KNOWLEDGE_LIBRARY_ASYNC_VIEWS') == '1'
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -29,11 +32,25 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'knowledge_library.query_budget.QueryBudgetMiddleware',
 ]
 
+QUERY_BUDGET_ENABLED = DEBUG
+QUERY_BUDGET_STRICT = False
+QUERY_BUDGET_N_PLUS_ONE_THRESHOLD = 5
+QUERY_BUDGET_DEFAULT = None
+QUERY_BUDGETS = {
+    'home': 8,
+    'resource_list': 6,
+    'resource_detail': 10,
+    'topic_detail': 10,
+    'profile': 8,
+    'admin_dashboard': 8,
+}
+
 ROOT_URLCONF = 'knowledge_library.urls'
 
 TEMPLATES = [
@@ -74,6 +91,44 @@ DATABASES = {
 }
 """
 
+# Версии фрагментов и пользователей сессии, статистика тем, поиск ключей регистрации
+# и лимиты частоты живут в кеше и сбрасываются в процессе, который изменил данные.
+# Поэтому при нескольких процессах (gunicorn -w N, run_jobs) кеш должен быть общим:
+# CACHE_URL=redis://host:6379/0 (пакет redis) или memcached://host:11211 (пакет pymemcache).
+# LocMemCache у каждого процесса свой — он годится только для одного процесса
+# (runserver); при DEBUG = False check выдает предупреждение library.W001
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://', 'unix://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': CACHE_URL.removeprefix('memcached://'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'knowledge-library',
+        }
+    }
+
+FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+# Ограничение частоты входа, регистрации и проверки ключей с одного IP (accounts/ratelimit.py).
+# RATELIMIT_RATES переопределяет лимиты по имени, например {'login': '20/m'}.
+# За обратным прокси укажите RATELIMIT_PROXY_COUNT — число прокси, дописывающих X-Forwarded-For
+RATELIMIT_ENABLED = True
+RATELIMIT_RATES = {}
+RATELIMIT_PROXY_COUNT = 0
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -101,12 +156,27 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Отдача файлов материалов фронт-прокси: None — через Django (FileResponse),
+# 'x-sendfile' — Apache/lighttpd, 'x-accel-redirect' — nginx с internal-локацией
+# MEDIA_ACCEL_REDIRECT_PREFIX, указывающей на MEDIA_ROOT
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE') or None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Очередь фоновых задач в базе (library/jobs.py), обработчики — manage.py run_jobs.
+# JOB_QUEUE_EAGER = True выполняет задачи сразу после коммита, без обработчиков
+JOB_WORKERS = 2
+JOB_QUEUE_EAGER = os.environ.get('JOB_QUEUE_EAGER') == '1'
+JOB_LOCK_TIMEOUT = 30 * 60
+JOB_KEEP_DAYS = 7
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 AUTH_USER_MODEL = 'accounts.CustomUser'
+# Явно: CachedAuthenticationMiddleware сверяет бэкенд из сессии с этим списком
+AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
 
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
@@ -1,19 +1,23 @@
 from django.contrib import admin
 from django.urls import path, include
+from django.views.generic import RedirectView
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 
+from .query_budget import query_report
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('accounts.urls')),
     path('', include('library.urls')),
-    path('login/', auth_views.LoginView.as_view(
-        template_name='accounts/login.html'
-    ), name='login'),
+    # Вход только через accounts.views.login_view — там ограничение частоты попыток;
+    # старый адрес перенаправляет туда же, сам пароли не принимает
+    path('login/', RedirectView.as_view(pattern_name='login', query_string=True, permanent=True)),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
+    path('query-report/', query_report, name='query_report'),
 ]
 
+# Файлы материалов отдаются только через library.views.resource_file (права, Range, ETag)
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Resource, Topic, Rating, Bookmark, ResourceTopic
+from django.utils import timezone
+
+from .models import Job, Resource, Topic, Rating, Bookmark, ResourceTopic
 
 class ResourceTopicInline(admin.TabularInline):
     model = ResourceTopic
@@ -17,6 +19,9 @@ class ResourceAdmin(admin.ModelAdmin):
     inlines = [ResourceTopicInline, RatingInline]
     filter_horizontal = ['topics']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).for_cards()
+
 @admin.register(Topic)
 class TopicAdmin(admin.ModelAdmin):
     list_display = ['name', 'created_at']
@@ -30,4 +35,18 @@ class RatingAdmin(admin.ModelAdmin):
 @admin.register(Bookmark)
 class BookmarkAdmin(admin.ModelAdmin):
     list_display = ['user', 'resource', 'created_at']
-    list_filter = ['created_at']
\ No newline at end of file
+    list_filter = ['created_at']
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'priority', 'attempts', 'run_at', 'created_at', 'finished_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['locked_by', 'locked_at', 'last_error', 'created_at', 'finished_at']
+    actions = ['retry']
+
+    @admin.action(description='Повторить выбранные задачи')
+    def retry(self, request, queryset):
+        count = queryset.exclude(status=Job.STATUS_RUNNING).update(
+            status=Job.STATUS_QUEUED, attempts=0, run_at=timezone.now(), finished_at=None,
+        )
+        self.message_user(request, f'Поставлено в очередь: {count}')
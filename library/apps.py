@@ -5,4 +5,8 @@ class LibraryConfig(AppConfig):
     name = 'library'
 
     def ready(self):
-        pass
\ No newline at end of file
+        from django.utils.module_loading import autodiscover_modules
+
+        from . import checks, signals  # noqa: F401
+        # Фоновые задачи регистрируются при импорте модулей tasks.py приложений
+        autodiscover_modules('tasks')
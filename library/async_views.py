@@ -0,0 +1,131 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count
+from django.http import Http404
+from django.shortcuts import render
+
+from . import views
+from .forms import RatingForm, SearchForm
+from .models import Bookmark, Rating, Resource, Topic
+from .pagination import KeysetPaginator
+from .stats import get_topic_stats
+
+# Асинхронные версии страниц чтения для ASGI (см. settings.ASYNC_READ_VIEWS).
+# Независимые запросы собираются через asyncio.gather, поэтому поток событий
+# не блокируется, пока ORM ждет базу. Шаблоны и валидация форм синхронные
+# и выполняются через sync_to_async.
+
+render_async = sync_to_async(render)
+
+
+async def _fetch(queryset):
+    return [obj async for obj in queryset]
+
+
+async def _get_user(request):
+    # В Django 4.2 нет request.auser(): ленивый пользователь загружается из сессии синхронно,
+    # после первого обращения объект уже вычислен и к базе не ходит
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+async def home(request):
+    latest_resources, popular_resources, topics = await asyncio.gather(
+        _fetch(Resource.objects.for_cards()[:10]),
+        _fetch(Resource.objects.popular().select_related('popularity').order_by(*views.POPULAR_ORDERING)[:10]),
+        _fetch(Topic.objects.annotate(resource_count=Count('resource'))[:8]),
+    )
+
+    context = {
+        'latest_resources': latest_resources,
+        'popular_resources': popular_resources,
+        'topics': topics,
+    }
+    return await render_async(request, 'library/home.html', context)
+
+
+async def resource_list(request):
+    form = SearchForm(request.GET or None)
+    resources, ordering = await sync_to_async(views.filter_resources)(form)
+
+    paginator = KeysetPaginator(resources, views.RESOURCES_PER_PAGE, ordering=ordering)
+    page_obj = await paginator.aget_page(request.GET.get('cursor'))
+
+    context = {
+        'page_obj': page_obj,
+        'form': form,
+        'search_query': request.GET.get('query', ''),
+        'querystring': views._querystring_without_cursor(request),
+    }
+    return await render_async(request, 'library/resource_list.html', context)
+
+
+async def resource_detail(request, pk):
+    if request.method == 'POST':
+        return await sync_to_async(views.resource_detail)(request, pk)
+
+    try:
+        resource = await Resource.objects.select_related('author').aget(pk=pk)
+    except Resource.DoesNotExist:
+        raise Http404('Материал не найден')
+
+    user = await _get_user(request)
+    user_rating = None
+    is_bookmarked = False
+    queries = [_fetch(views.similar_links(resource)), _fetch(resource.ratings.select_related('user'))]
+    if user.is_authenticated:
+        queries += [
+            Rating.objects.filter(resource=resource, user=user).afirst(),
+            Bookmark.objects.filter(resource=resource, user=user).aexists(),
+        ]
+    similar_links, reviews, *personal = await asyncio.gather(*queries)
+    if personal:
+        user_rating, is_bookmarked = personal
+    can_edit, can_delete = views.resource_permissions(user, resource)
+
+    context = {
+        'resource': resource,
+        'user_rating': user_rating,
+        'is_bookmarked': is_bookmarked,
+        'rating_form': RatingForm(),
+        'can_edit': can_edit,
+        'can_delete': can_delete,
+        'similar_resources': [link.similar for link in similar_links],
+        'reviews': reviews,
+    }
+    return await render_async(request, 'library/resource_detail.html', context)
+
+
+async def topic_detail(request, pk):
+    try:
+        topic = await Topic.objects.aget(pk=pk)
+    except Topic.DoesNotExist:
+        raise Http404('Тема не найдена')
+
+    resources = Resource.objects.for_cards().filter(topics=topic)
+    paginator = KeysetPaginator(resources, views.RESOURCES_PER_PAGE)
+    all_topics = Topic.objects.exclude(pk=pk).annotate(
+        resource_count=Count('resource')
+    ).order_by('-resource_count')[:6]
+
+    page_obj, all_topics, topic_stats = await asyncio.gather(
+        paginator.aget_page(request.GET.get('cursor')),
+        _fetch(all_topics),
+        sync_to_async(get_topic_stats)(topic.pk),
+    )
+
+    context = {
+        'topic': topic,
+        'resources': resources,
+        'page_obj': page_obj,
+        'querystring': views._querystring_without_cursor(request),
+        'all_topics': all_topics,
+        'topic_stats': topic_stats,
+        'video_count': topic_stats.count_by_type('video'),
+        'pdf_count': topic_stats.count_by_type('pdf'),
+        'link_count': topic_stats.count_by_type('link'),
+        'note_count': topic_stats.count_by_type('note'),
+        'unique_authors': topic_stats.authors,
+    }
+    return await render_async(request, 'library/topic_detail.html', context)
@@ -0,0 +1,42 @@
+import uuid
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import Model
+
+VERSION_PREFIX = 'library:version'
+
+
+def is_shared_cache(alias='default'):
+    # bump() в одном процессе виден другим, только если кеш у них общий
+    return not isinstance(caches[alias], LocMemCache)
+
+
+def model_key(model, pk):
+    return f'{model._meta.label_lower}:{pk}'
+
+
+def _version_key(dependency):
+    if isinstance(dependency, Model):
+        dependency = model_key(dependency, dependency.pk)
+    return f'{VERSION_PREFIX}:{dependency}'
+
+
+def get_versions(dependencies):
+    """Возвращает текущие версии зависимостей фрагмента.
+
+    Зависимость — экземпляр модели или строка-группа (например, 'topics').
+    Отсутствующая версия создается заново, поэтому вытеснение ключа версии
+    из кеша не может вернуть устаревший фрагмент.
+    """
+    keys = [_version_key(dependency) for dependency in dependencies]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*dependencies):
+    cache.set_many({_version_key(dependency): uuid.uuid4().hex for dependency in dependencies}, None)
@@ -0,0 +1,28 @@
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+from django.urls import reverse
+
+from .models import Topic
+
+
+def _render(view, path, **kwargs):
+    request = RequestFactory().get(path)
+    request.user = AnonymousUser()
+    return view(request, **kwargs)
+
+
+def warm_caches(topic_limit=None):
+    """Рендерит главную, первую страницу каталога и страницы тем,
+    чтобы фрагменты карточек и статистика тем попали в кеш."""
+    from . import views
+
+    rendered = [
+        _render(views.home, reverse('home')),
+        _render(views.resource_list, reverse('resource_list')),
+    ]
+    topics = Topic.objects.order_by('pk').values_list('pk', flat=True)
+    if topic_limit is not None:
+        topics = topics[:topic_limit]
+    for pk in topics:
+        rendered.append(_render(views.topic_detail, reverse('topic_detail', args=[pk]), pk=pk))
+    return len(rendered)
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+from .cache_versions import is_shared_cache
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    # С отладкой сайт обычно работает в одном процессе runserver — там LocMemCache достаточно
+    if settings.DEBUG or is_shared_cache():
+        return []
+    return [Warning(
+        'Кеш по умолчанию — LocMemCache, он у каждого процесса свой.',
+        hint=('Сброс версий фрагментов, статистики тем и ключей регистрации, лимиты частоты и прогрев '
+              'кеша действуют только в одном процессе. Задайте CACHE_URL (Redis или Memcached) '
+              'или запускайте сайт и run_jobs одним процессом.'),
+        id='library.W001',
+    )]
@@ -0,0 +1,120 @@
+import csv
+import json
+import zlib
+
+from django.db.models import Prefetch
+
+from .models import Resource, Topic
+
+FORMATS = ('jsonl', 'csv')
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+CSV_FIELDS = [
+    'id', 'external_id', 'title', 'description', 'resource_type', 'url', 'file', 'author_id', 'author',
+    'topic_ids', 'topics', 'rating_count', 'rating_avg', 'created_at', 'updated_at',
+]
+CHUNK_SIZE = 2000
+
+
+def export_queryset(queryset=None):
+    if queryset is None:
+        queryset = Resource.objects.all()
+    # prefetch_related(None) сбрасывает prefetch из for_cards(), чтобы не было конфликта lookup
+    return queryset.select_related('author').prefetch_related(None).prefetch_related(
+        Prefetch('topics', queryset=Topic.objects.only('id', 'name').order_by('pk'))
+    ).order_by('pk')
+
+
+def resource_row(resource):
+    topics = list(resource.topics.all())
+    return {
+        'id': resource.pk,
+        'external_id': resource.external_id or '',
+        'title': resource.title,
+        'description': resource.description,
+        'resource_type': resource.resource_type,
+        'url': resource.url,
+        'file': resource.file.name or '',
+        'author_id': resource.author_id,
+        'author': resource.author.username,
+        'topic_ids': [topic.pk for topic in topics],
+        'topics': [topic.name for topic in topics],
+        'rating_count': resource.rating_count,
+        'rating_avg': round(resource.rating_avg, 2),
+        'created_at': resource.created_at.isoformat(),
+        'updated_at': resource.updated_at.isoformat(),
+    }
+
+
+def iter_rows(queryset, chunk_size=CHUNK_SIZE):
+    # iterator() с chunk_size выполняет prefetch_related для каждой пачки отдельно,
+    # так что в памяти одновременно не больше chunk_size материалов
+    for resource in queryset.iterator(chunk_size=chunk_size):
+        yield resource_row(resource)
+
+
+def _jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+class _Line:
+    # csv.writer пишет в объект с write(); забираем строку сразу, без буфера
+    def write(self, value):
+        return value
+
+
+def _csv(rows):
+    writer = csv.writer(_Line())
+    yield '\ufeff' + writer.writerow(CSV_FIELDS)  # BOM, чтобы Excel распознал UTF-8
+    for row in rows:
+        row = dict(row, topic_ids=' '.join(map(str, row['topic_ids'])), topics='; '.join(row['topics']))
+        yield writer.writerow([row[field] for field in CSV_FIELDS])
+
+
+def _buffered(chunks, size=64 * 1024):
+    # Склеиваем короткие строки, чтобы не писать в сокет по одной записи
+    buffer = []
+    buffered = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield b''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzip(chunks, level=6, flush_size=64 * 1024):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 — формат gzip
+    pending = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if data:
+            yield data
+        if pending >= flush_size:
+            # Отдаем сжатые данные порциями, иначе клиент долго не получит ни байта
+            data = compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+            if data:
+                yield data
+    yield compressor.flush()
+
+
+def stream_export(queryset, fmt='jsonl', compress=False, chunk_size=CHUNK_SIZE):
+    """Генератор байтов выгрузки материалов в JSONL или CSV, при compress — в gzip."""
+    if fmt not in FORMATS:
+        raise ValueError(f'Неизвестный формат: {fmt}')
+    encode = _jsonl if fmt == 'jsonl' else _csv
+    chunks = (line.encode('utf-8') for line in encode(iter_rows(queryset, chunk_size)))
+    return _gzip(chunks) if compress else _buffered(chunks)
+
+
+def export_filename(fmt, compress, date):
+    name = f'resources-{date:%Y%m%d}.{fmt}'
+    return f'{name}.gz' if compress else name
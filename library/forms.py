@@ -44,6 +44,11 @@ class SearchForm(forms.Form):
         label='По дату',
         widget=forms.DateInput(attrs={'type': 'date'})
     )
+    sort = forms.ChoiceField(
+        choices=[('', 'По умолчанию'), ('popular', 'Популярные')],
+        required=False,
+        label='Сортировка'
+    )
 
 class RatingForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,208 @@
+import logging
+import os
+import random
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+RETRY_BASE = 30         # секунд до первого повтора, дальше удваивается
+RETRY_MAX = 6 * 3600
+LOCK_TIMEOUT = 30 * 60  # задача «выполняется» дольше — обработчик считается упавшим
+
+TASKS = {}
+
+
+class Task:
+    def __init__(self, func, name, priority, max_attempts):
+        self.func = func
+        self.name = name
+        self.priority = priority
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+
+def task(name, priority=PRIORITY_NORMAL, max_attempts=5):
+    """Регистрирует функцию как фоновую задачу.
+
+    Задачи ищутся в модулях tasks.py приложений (подключаются в
+    LibraryConfig.ready); аргументы должны сериализоваться в JSON.
+        @task('library.release_file')
+        def release_file(name): ...
+    """
+    def decorator(func):
+        if name in TASKS:
+            raise ValueError(f'Задача {name} уже зарегистрирована')
+        TASKS[name] = Task(func, name, priority, max_attempts)
+        return func
+    return decorator
+
+
+def enqueue(name, args=(), kwargs=None, priority=None, run_at=None, delay=None, max_attempts=None):
+    """Ставит задачу в очередь и возвращает Job.
+
+    Запись создается в текущей транзакции: при откате задача исчезнет вместе
+    с остальными изменениями, а обработчик увидит ее только после коммита.
+    С JOB_QUEUE_EAGER = True задача выполняется в этом же процессе после коммита —
+    удобно для разработки без запущенного run_jobs.
+    """
+    registered = TASKS.get(name)
+    if registered is None:
+        raise LookupError(f'Неизвестная задача: {name}')
+    if run_at is None:
+        run_at = timezone.now() + (delay or timedelta())
+    job = Job(
+        name=name,
+        args=list(args),
+        kwargs=kwargs or {},
+        priority=registered.priority if priority is None else priority,
+        run_at=run_at,
+        max_attempts=registered.max_attempts if max_attempts is None else max_attempts,
+    )
+    if getattr(settings, 'JOB_QUEUE_EAGER', False):
+        transaction.on_commit(lambda: registered(*job.args, **job.kwargs))
+        return job
+    job.save()
+    return job
+
+
+def worker_name(index=0):
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'[:100]
+
+
+def _ready_jobs(now):
+    return Job.objects.filter(status=Job.STATUS_QUEUED, run_at__lte=now).order_by('-priority', 'run_at', 'pk')
+
+
+def claim(worker, candidates=5):
+    """Берет в работу следующую задачу или возвращает None.
+
+    На MySQL/PostgreSQL строки блокируются SELECT ... FOR UPDATE SKIP LOCKED,
+    и обработчики не мешают друг другу. В SQLite такого нет: берем несколько
+    кандидатов и захватываем первый условным UPDATE ... WHERE status = 'queued' —
+    из нескольких процессов строку обновит ровно один.
+    """
+    now = timezone.now()
+    claimed = {
+        'status': Job.STATUS_RUNNING,
+        'locked_by': worker,
+        'locked_at': now,
+        'attempts': F('attempts') + 1,
+    }
+    try:
+        if connection.features.has_select_for_update_skip_locked:
+            with transaction.atomic():
+                pk = _ready_jobs(now).select_for_update(skip_locked=True).values_list('pk', flat=True).first()
+                if pk is None or not Job.objects.filter(pk=pk).update(**claimed):
+                    return None
+                return Job.objects.get(pk=pk)
+        for pk in _ready_jobs(now).values_list('pk', flat=True)[:candidates]:
+            if Job.objects.filter(pk=pk, status=Job.STATUS_QUEUED).update(**claimed):
+                return Job.objects.get(pk=pk)
+    except OperationalError:
+        # SQLite: база занята записью другого процесса — попробуем на следующем цикле
+        logger.warning('Очередь задач занята, повтор позже', exc_info=True)
+    return None
+
+
+def retry_delay(attempts):
+    # Экспоненциальная пауза с разбросом ±20%, чтобы упавшие разом задачи не вернулись разом
+    return min(RETRY_BASE * 2 ** max(attempts - 1, 0), RETRY_MAX) * random.uniform(0.8, 1.2)
+
+
+def run(job):
+    """Выполняет захваченную задачу и записывает результат. Возвращает True при успехе."""
+    registered = TASKS.get(job.name)
+    try:
+        if registered is None:
+            raise LookupError(f'Неизвестная задача: {job.name}')
+        registered(*job.args, **job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Задача %s #%s завершилась ошибкой (попытка %s из %s)',
+                         job.name, job.pk, job.attempts, job.max_attempts)
+        fields = {'locked_by': '', 'locked_at': None, 'last_error': error[-5000:]}
+        if job.attempts >= job.max_attempts or registered is None:
+            fields.update(status=Job.STATUS_FAILED, finished_at=timezone.now())
+        else:
+            fields.update(
+                status=Job.STATUS_QUEUED,
+                run_at=timezone.now() + timedelta(seconds=retry_delay(job.attempts)),
+            )
+        Job.objects.filter(pk=job.pk).update(**fields)
+        return False
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.STATUS_DONE, locked_by='', locked_at=None, finished_at=timezone.now(),
+    )
+    return True
+
+
+def run_pending(worker=None, limit=None):
+    """Выполняет готовые задачи в текущем процессе, пока очередь не опустеет."""
+    worker = worker or worker_name()
+    done = 0
+    while limit is None or done < limit:
+        job = claim(worker)
+        if job is None:
+            break
+        run(job)
+        done += 1
+        close_old_connections()
+    return done
+
+
+def requeue_stale(timeout=None):
+    """Возвращает в очередь задачи обработчиков, которые умерли посреди работы.
+
+    timeout по умолчанию — JOB_LOCK_TIMEOUT из настроек.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'JOB_LOCK_TIMEOUT', LOCK_TIMEOUT)
+    stale = Job.objects.filter(
+        status=Job.STATUS_RUNNING, locked_at__lt=timezone.now() - timedelta(seconds=timeout),
+    )
+    reset = {'locked_by': '', 'locked_at': None, 'last_error': 'Обработчик не завершил задачу'}
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.STATUS_FAILED, finished_at=timezone.now(), **reset,
+    )
+    return failed + stale.update(status=Job.STATUS_QUEUED, **reset)
+
+
+def purge_finished(older_than):
+    return Job.objects.filter(
+        status=Job.STATUS_DONE, finished_at__lt=timezone.now() - older_than,
+    ).delete()[0]
+
+
+def work(index, stop, poll_interval=1.0, max_jobs=None):
+    """Цикл одного процесса-обработчика: берет задачи, пока не выставлен stop."""
+    worker = worker_name(index)
+    done = 0
+    while not stop.is_set() and (max_jobs is None or done < max_jobs):
+        close_old_connections()
+        job = claim(worker)
+        if job is None:
+            stop.wait(poll_interval)
+            continue
+        try:
+            run(job)
+        except OperationalError:
+            # Не удалось записать результат (база занята): задача останется «выполняется»
+            # и вернется в очередь через requeue_stale — задачи должны быть идемпотентны
+            logger.exception('Не удалось сохранить результат задачи %s #%s', job.name, job.pk)
+        done += 1
+    return done
@@ -0,0 +1,166 @@
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from library.models import Resource, Topic
+
+User = get_user_model()
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет основные страницы через тестовый клиент и выводит p50/p95, число запросов '
+            'и пик памяти по каждой в JSON для сравнения между коммитами')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--cold', action='store_true', help='Очищать кеш перед каждым запросом')
+        parser.add_argument('--only', nargs='*', help='Запустить только перечисленные сценарии')
+        parser.add_argument('--output', help='Записать JSON в файл вместо stdout')
+        parser.add_argument('--compare', help='JSON прошлого прогона: вывести изменения p50 и числа запросов')
+
+    def handle(self, *args, **options):
+        scenarios = self._scenarios()
+        if options['only']:
+            scenarios = [s for s in scenarios if s[0] in options['only']]
+
+        # Инструментирование запросов в middleware исказило бы замеры
+        with override_settings(QUERY_BUDGET_ENABLED=False, ALLOWED_HOSTS=['localhost']):
+            results = {
+                name: self._measure(url, user, options)
+                for name, url, user in scenarios
+            }
+
+        report = {
+            'revision': _git_revision(),
+            'timestamp': timezone.now().isoformat(),
+            'iterations': options['iterations'],
+            'cold_cache': options['cold'],
+            'dataset': {
+                'users': User.objects.count(),
+                'topics': Topic.objects.count(),
+                'resources': Resource.objects.count(),
+            },
+            'views': results,
+        }
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                fh.write(output)
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            self._compare(options['compare'], results)
+
+    def _scenarios(self):
+        resource = Resource.objects.order_by('-rating_count').first()
+        topic = Topic.objects.annotate(n=Count('resource')).order_by('-n').first()
+        author = User.objects.annotate(n=Count('resources')).order_by('-n').first()
+        superuser = User.objects.filter(is_superuser=True).first()
+        if resource is None or topic is None or author is None:
+            raise CommandError('Нет данных. Сначала выполните manage.py seed_data')
+
+        today = timezone.localdate()
+        resource_list = reverse('resource_list')
+        scenarios = [
+            ('home', reverse('home'), None),
+            ('resource_list', resource_list, None),
+            ('resource_list_query', f'{resource_list}?query=программирование', None),
+            ('resource_list_type', f'{resource_list}?resource_type=pdf', None),
+            ('resource_list_topic', f'{resource_list}?topic={topic.pk}', None),
+            ('resource_list_dates',
+             f'{resource_list}?date_from={today - timedelta(days=90)}&date_to={today}', None),
+            ('resource_list_all_filters',
+             f'{resource_list}?query=основы&resource_type=video&topic={topic.pk}'
+             f'&date_from={today - timedelta(days=365)}&date_to={today}', None),
+            ('resource_detail', reverse('resource_detail', args=[resource.pk]), author),
+            ('topic_detail', reverse('topic_detail', args=[topic.pk]), None),
+            ('profile', reverse('profile'), author),
+        ]
+        if superuser is not None:
+            scenarios.append(('admin_dashboard', reverse('admin_dashboard'), superuser))
+        return scenarios
+
+    def _measure(self, url, user, options):
+        client = Client(SERVER_NAME='localhost')
+        if user is not None:
+            client.force_login(user)
+
+        def request():
+            if options['cold']:
+                cache.clear()
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: код ответа {response.status_code}')
+            return response
+
+        for _ in range(options['warmup']):
+            request()
+
+        timings = []
+        for _ in range(options['iterations']):
+            started = time.perf_counter()
+            request()
+            timings.append((time.perf_counter() - started) * 1000)
+
+        # CaptureQueriesContext не подходит: request_started очищает connection.queries_log
+        queries = []
+        with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            request()
+
+        tracemalloc.start()
+        try:
+            request()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'url': url,
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(_percentile(timings, 95), 2),
+            'queries': len(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def _compare(self, path, results):
+        with open(path, encoding='utf-8') as fh:
+            baseline = json.load(fh)['views']
+        self.stderr.write(f'{"сценарий":<28}{"p50, мс":>20}{"запросы":>14}')
+        for name, current in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            self.stderr.write(
+                f'{name:<28}{before["p50_ms"]:>9} → {current["p50_ms"]:<8}'
+                f'{before["queries"]:>6} → {current["queries"]:<5}'
+            )
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library import similar
+
+
+class Command(BaseCommand):
+    help = ('Подбирает похожие материалы (косинус по темам и оценкам) и сохраняет их в таблицу. '
+            'Без --resource пересчитывает все — удобно запускать по расписанию, раз в сутки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resource', type=int, action='append', dest='resources', metavar='ID',
+                            help='Пересчитать только этот материал и зависящие от него списки (можно несколько раз)')
+
+    def handle(self, *args, **options):
+        if not similar.available():
+            raise CommandError('Для подбора похожих материалов нужен NumPy (pip install numpy)')
+        started = time.monotonic()
+        updated = similar.refresh(options['resources'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено списков: {updated} за {time.monotonic() - started:.1f} с'
+        ))
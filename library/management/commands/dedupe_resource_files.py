@@ -0,0 +1,53 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from library.models import Resource
+from library.storage import content_hash, hashed_name, is_hashed_name
+
+
+class Command(BaseCommand):
+    help = ('Переносит файлы материалов, загруженные до хранилища по хешу, под имена от sha256 '
+            'содержимого; одинаковые файлы сливаются в один')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет сделано')
+
+    def handle(self, *args, **options):
+        storage = Resource._meta.get_field('file').storage
+        names = (
+            Resource.objects.exclude(file='').exclude(file__isnull=True)
+            .order_by().values_list('file', flat=True).distinct()
+        )
+        moved = merged = missing = 0
+        freed = 0
+        for name in names.iterator():
+            if is_hashed_name(name):
+                continue
+            if not storage.exists(name):
+                missing += 1
+                self.stderr.write(f'Нет файла: {name}')
+                continue
+            with storage.open(name) as fh:
+                target = hashed_name(name, content_hash(File(fh)))
+            exists = storage.exists(target)
+            if options['dry_run']:
+                self.stdout.write(f"{name} -> {target}{' (дубликат)' if exists else ''}")
+                continue
+
+            if exists and storage.touch(target):
+                merged += 1
+                freed += storage.size(name)
+            else:
+                with storage.open(name) as fh:
+                    target = storage.save(name, File(fh))
+                moved += 1
+            # update() не вызывает сигналы — старый файл удаляем сами после коммита
+            with transaction.atomic():
+                Resource.objects.filter(file=name).update(file=target)
+                transaction.on_commit(lambda name=name: Resource.release_file(name))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено: {moved}, слито дубликатов: {merged} ({freed / 1024 / 1024:.1f} МБ), '
+            f'отсутствует: {missing}'
+        ))
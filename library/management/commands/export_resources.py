@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from library import export
+
+
+class Command(BaseCommand):
+    help = 'Потоково выгружает материалы с темами, авторами и оценками в JSONL или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=export.FORMATS, default='jsonl')
+        parser.add_argument('--output', help='Файл для записи; по умолчанию stdout')
+        parser.add_argument('--gzip', action='store_true', help='Сжимать выгрузку на лету')
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        stream = export.stream_export(
+            export.export_queryset(), options['format'], options['gzip'], options['chunk_size']
+        )
+        if options['output']:
+            with open(options['output'], 'wb') as fh:
+                written = self._write(stream, fh)
+            self.stderr.write(self.style.SUCCESS(f"Записано {written} байт в {options['output']}"))
+        else:
+            self._write(stream, sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+
+    def _write(self, stream, fh):
+        written = 0
+        for chunk in stream:
+            fh.write(chunk)
+            written += len(chunk)
+        return written
@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from library import thumbnails
+from library.cache_versions import bump
+from library.models import Resource
+
+
+class Command(BaseCommand):
+    help = 'Создает недостающие превью для файлов материалов и фото профилей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Пересоздать и уже готовые превью')
+
+    def handle(self, *args, **options):
+        sources = [
+            (Resource, Resource._meta.get_field('file')),
+            (get_user_model(), get_user_model()._meta.get_field('profile_picture')),
+        ]
+        created = skipped = failed = 0
+        for model, field in sources:
+            rows = (
+                model.objects.exclude(**{field.name: ''}).exclude(**{f'{field.name}__isnull': True})
+                .order_by().values_list('pk', field.name)
+            )
+            done = set()
+            for pk, name in rows.iterator():
+                if name in done or not thumbnails.can_preview(name):
+                    continue
+                done.add(name)
+                if thumbnails.is_ready(name) and not options['force']:
+                    skipped += 1
+                    continue
+                # Синхронно: команда для бэкфилла, очередь задач здесь не нужна
+                try:
+                    thumbnails.generate(field.storage, name)
+                except thumbnails.GENERATION_ERRORS as exc:
+                    failed += 1
+                    self.stderr.write(f'{name}: {exc}')
+                    continue
+                bump(*[instance for instance in model.objects.filter(**{field.name: name})])
+                created += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано превью: {created}, уже были: {skipped}, ошибок: {failed}'
+        ))
@@ -0,0 +1,53 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from library import importer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Пакетно загружает материалы из JSONL или CSV. Строки с external_id обновляют '
+            'ранее загруженные материалы, повторный запуск не создает дубликатов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--author', required=True, help='Имя пользователя — автора новых материалов')
+        parser.add_argument('--format', choices=importer.FORMATS,
+                            help='По умолчанию определяется по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=importer.BATCH_SIZE)
+        parser.add_argument('--no-create-topics', action='store_true',
+                            help='Отклонять строки с неизвестными темами вместо их создания')
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options['author'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь '{options['author']}' не найден")
+
+        fmt = options['format'] or ('csv' if options['path'].endswith('.csv') else 'jsonl')
+        pipeline = importer.ResourceImporter(
+            author,
+            batch_size=options['batch_size'],
+            create_topics=not options['no_create_topics'],
+            progress=self._progress,
+        )
+        try:
+            with open(options['path'], 'rb') as fh:
+                report = pipeline.run(importer.read_rows(fh, fmt))
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        for error in report.errors[:50]:
+            self.stderr.write(f"строка {error['line']}: {error['error']}")
+        if len(report.errors) > 50:
+            self.stderr.write(f'... и еще {len(report.errors) - 50} ошибок')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: {report.created}, обновлено: {report.updated}, новых тем: {report.topics_created}, '
+            f'связей: {report.links_created}, ошибок: {len(report.errors)} '
+            f'за {report.elapsed:.1f} с ({report.rate:.0f} строк/с)'
+        ))
+
+    def _progress(self, report):
+        self.stderr.write(f'  обработано {report.processed} строк, {report.rate:.0f} строк/с')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from library.models import ResourcePopularity
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинг популярности материалов и среднюю оценку по библиотеке, '
+            'от которой считается байесовское среднее. Достаточно запускать по расписанию, раз в сутки')
+
+    def handle(self, *args, **options):
+        updated = ResourcePopularity.refresh()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено материалов: {updated}, средняя оценка: {ResourcePopularity.prior_mean():.2f}'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from library import search
+from library.models import Resource
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс материалов (SQLite FTS5)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Полнотекстовый индекс поддерживается только для SQLite')
+
+        with transaction.atomic():
+            total = search.rebuild_index(Resource.objects.all(), batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано материалов: {total}'))
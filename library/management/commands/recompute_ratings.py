@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce
+
+from library.models import Rating, Resource, ResourcePopularity
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные агрегаты оценок (rating_count, rating_sum, rating_avg) у материалов '
+            'и рейтинг популярности')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Сколько материалов обновлять одним UPDATE')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        ratings = Rating.objects.filter(resource=OuterRef('pk')).order_by().values('resource')
+        count_sq = Subquery(ratings.annotate(c=Count('id')).values('c'), output_field=IntegerField())
+        sum_sq = Subquery(ratings.annotate(s=Sum('rating')).values('s'), output_field=IntegerField())
+        avg_sq = Subquery(
+            ratings.annotate(a=Cast(Sum('rating'), FloatField()) / Count('id')).values('a'),
+            output_field=FloatField()
+        )
+
+        ids = Resource.objects.order_by('pk').values_list('pk', flat=True)
+        last_pk = 0
+        updated = 0
+        while True:
+            batch = list(ids.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                updated += Resource.objects.filter(pk__gte=batch[0], pk__lte=batch[-1]).update(
+                    rating_count=Coalesce(count_sq, Value(0)),
+                    rating_sum=Coalesce(sum_sq, Value(0)),
+                    rating_avg=Coalesce(avg_sq, Value(0.0)),
+                )
+            last_pk = batch[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано материалов: {updated}'))
+        # Рейтинг популярности строится из тех же агрегатов
+        self.stdout.write(self.style.SUCCESS(f'Обновлен рейтинг популярности: {ResourcePopularity.refresh()}'))
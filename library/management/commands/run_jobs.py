@@ -0,0 +1,82 @@
+import multiprocessing
+import signal
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from library import jobs, worker
+
+MAINTENANCE_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = 'Запускает пул процессов, выполняющих фоновые задачи из очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=getattr(settings, 'JOB_WORKERS', 2),
+                            help='Число процессов-обработчиков')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Пауза в секундах, когда очередь пуста')
+        parser.add_argument('--max-jobs', type=int, default=None,
+                            help='Перезапускать процесс после стольких задач (утечки памяти)')
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить готовые задачи в текущем процессе и выйти')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            # Запуск по cron — единственный обработчик: задачи упавших запусков возвращаем сами
+            self._maintenance()
+            done = jobs.run_pending()
+            self.stdout.write(self.style.SUCCESS(f'Выполнено задач: {done}'))
+            return
+
+        stop = multiprocessing.Event()
+        # Сам stop.set() в обработчике сигнала вызывать нельзя: прерванный stop.wait()
+        # держит внутреннюю блокировку события, и процесс зависнет
+        self.stopping = False
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, self._request_stop)
+
+        pool = {}
+        last_maintenance = 0
+        self.stdout.write(f"Запущено обработчиков: {options['processes']}")
+        while not self.stopping:
+            for index in range(options['processes']):
+                process = pool.get(index)
+                if process is None or not process.is_alive():
+                    if process is not None and process.exitcode:
+                        self.stderr.write(f'Обработчик {index} завершился с кодом {process.exitcode}')
+                    pool[index] = self._start(index, stop, options)
+
+            if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                self._maintenance()
+                last_maintenance = time.monotonic()
+            time.sleep(options['poll_interval'])
+
+        self.stdout.write('Остановка: ждем завершения текущих задач')
+        stop.set()
+        for process in pool.values():
+            process.join()
+
+    def _maintenance(self):
+        requeued = jobs.requeue_stale()
+        purged = jobs.purge_finished(timedelta(days=getattr(settings, 'JOB_KEEP_DAYS', 7)))
+        if requeued or purged:
+            self.stdout.write(f'Возвращено в очередь: {requeued}, удалено выполненных: {purged}')
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+
+    def _start(self, index, stop, options):
+        # Дочерний процесс не должен унаследовать открытое соединение с базой
+        connections.close_all()
+        process = multiprocessing.Process(
+            target=worker.main,
+            args=(index, stop, options['poll_interval'], options['max_jobs']),
+            name=f'run_jobs-{index}',
+        )
+        process.start()
+        return process
@@ -0,0 +1,203 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from library.models import Bookmark, Rating, Resource, ResourceTopic, Topic
+
+User = get_user_model()
+
+WORDS = [
+    'основы', 'введение', 'курс', 'практикум', 'лекция', 'задачи', 'теория', 'алгоритмы', 'математика',
+    'физика', 'химия', 'история', 'литература', 'программирование', 'python', 'django', 'базы', 'данных',
+    'анализ', 'статистика', 'геометрия', 'алгебра', 'биология', 'экономика', 'философия', 'английский',
+    'грамматика', 'сети', 'безопасность', 'проектирование', 'методы', 'решения', 'примеры', 'конспект',
+]
+
+# Доли ролей среди сгенерированных пользователей
+ROLE_WEIGHTS = {'student': 85, 'teacher': 13, 'admin': 2}
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    # bulk_create вызывает pre_save полей, и auto_now/auto_now_add затерли бы сгенерированные даты
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = ('Детерминированно заполняет базу синтетическими данными через bulk_create: '
+            'пользователи всех ролей, темы, материалы всех типов, связи с темами, оценки и избранное')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--topics', type=int, default=50)
+        parser.add_argument('--resources', type=int, default=10000)
+        parser.add_argument('--ratings', type=int, default=100000, help='Примерное общее число оценок')
+        parser.add_argument('--bookmarks', type=int, default=50000, help='Примерное общее число закладок')
+        parser.add_argument('--topics-per-resource', type=int, default=3)
+        parser.add_argument('--days', type=int, default=730, help='За сколько дней распределить даты создания')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='seed', help='Префикс имен пользователей и тем')
+        parser.add_argument('--skip-index', action='store_true',
+                            help='Не пересчитывать агрегаты оценок и поисковый индекс после загрузки')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = options['prefix']
+        self.now = timezone.now()
+        self.days = options['days']
+
+        if User.objects.filter(username__startswith=f"{self.prefix}_user_").exists():
+            raise CommandError(f"Данные с префиксом '{self.prefix}' уже есть. Укажите другой --prefix")
+
+        started = time.perf_counter()
+        with explicit_timestamps(User, Topic, Resource, ResourceTopic, Rating, Bookmark):
+            user_ids, author_ids = self._create_users(options['users'])
+            topic_ids = self._create_topics(options['topics'])
+            resource_ids = self._create_resources(options['resources'], author_ids)
+            self._create_links(resource_ids, topic_ids, options['topics_per_resource'])
+            self._create_pairs(Rating, 'оценок', resource_ids, user_ids, options['ratings'], with_rating=True)
+            self._create_pairs(Bookmark, 'закладок', resource_ids, user_ids, options['bookmarks'])
+
+        if not options['skip_index']:
+            call_command('recompute_ratings', stdout=self.stdout)
+            call_command('rebuild_search_index', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(f'Готово за {time.perf_counter() - started:.1f} с'))
+
+    def _random_date(self):
+        return self.now - timedelta(seconds=self.rng.randrange(self.days * 86400))
+
+    def _bulk(self, model, objects):
+        created = 0
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                with transaction.atomic():
+                    model.objects.bulk_create(batch, batch_size=self.batch_size)
+                created += len(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=self.batch_size)
+            created += len(batch)
+        return created
+
+    def _new_ids(self, model, last_pk):
+        return list(model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True))
+
+    def _last_pk(self, model):
+        return model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+    def _create_users(self, count):
+        last_pk = self._last_pk(User)
+        password = make_password('password')  # один хеш на всех — хеширование слишком медленное
+        roles = self.rng.choices(list(ROLE_WEIGHTS), weights=list(ROLE_WEIGHTS.values()), k=count)
+
+        def users():
+            for i, role in enumerate(roles):
+                yield User(
+                    username=f'{self.prefix}_user_{i}',
+                    email=f'{self.prefix}_user_{i}@example.com',
+                    password=password,
+                    role=role,
+                    is_staff=role in ('teacher', 'admin'),
+                    is_superuser=role == 'admin',
+                    date_joined=self._random_date(),
+                )
+
+        self.stdout.write(f'Пользователей: {self._bulk(User, users())}')
+        rows = list(User.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'role'))
+        user_ids = [pk for pk, _ in rows]
+        author_ids = [pk for pk, role in rows if role in ('teacher', 'admin')] or user_ids
+        return user_ids, author_ids
+
+    def _create_topics(self, count):
+        last_pk = self._last_pk(Topic)
+
+        def topics():
+            for i in range(count):
+                now = self._random_date()
+                yield Topic(
+                    name=f'{self.prefix} тема {i} {self.rng.choice(WORDS)}',
+                    description=' '.join(self.rng.choices(WORDS, k=8)),
+                    color=f'#{self.rng.randrange(0x1000000):06x}',
+                    created_at=now,
+                    updated_at=now,
+                )
+
+        self.stdout.write(f'Тем: {self._bulk(Topic, topics())}')
+        return self._new_ids(Topic, last_pk)
+
+    def _create_resources(self, count, author_ids):
+        last_pk = self._last_pk(Resource)
+        types = [value for value, _ in Resource.TYPE_CHOICES]
+
+        def resources():
+            for i in range(count):
+                resource_type = self.rng.choice(types)
+                created_at = self._random_date()
+                yield Resource(
+                    title=' '.join(self.rng.choices(WORDS, k=4)).capitalize(),
+                    description=' '.join(self.rng.choices(WORDS, k=30)),
+                    resource_type=resource_type,
+                    url=f'https://example.com/{i}' if resource_type in ('link', 'video') else '',
+                    author_id=self.rng.choice(author_ids),
+                    created_at=created_at,
+                    updated_at=created_at,
+                )
+
+        self.stdout.write(f'Материалов: {self._bulk(Resource, resources())}')
+        return self._new_ids(Resource, last_pk)
+
+    def _create_links(self, resource_ids, topic_ids, per_resource):
+        if not topic_ids:
+            return
+        per_resource = min(per_resource, len(topic_ids))
+
+        def links():
+            for resource_id in resource_ids:
+                for topic_id in self.rng.sample(topic_ids, self.rng.randint(1, per_resource)):
+                    yield ResourceTopic(resource_id=resource_id, topic_id=topic_id, added_at=self.now)
+
+        self.stdout.write(f'Связей с темами: {self._bulk(ResourceTopic, links())}')
+
+    def _create_pairs(self, model, label, resource_ids, user_ids, total, with_rating=False):
+        if not resource_ids or not user_ids or total <= 0:
+            return
+        average = total / len(resource_ids)
+        ceiling = min(len(user_ids), max(1, int(average * 2)))
+
+        def pairs():
+            for resource_id in resource_ids:
+                k = min(ceiling, int(self.rng.expovariate(1 / average))) if average else 0
+                for user_id in self.rng.sample(user_ids, k):
+                    fields = {'resource_id': resource_id, 'user_id': user_id, 'created_at': self._random_date()}
+                    if with_rating:
+                        # Смещенное к высоким оценкам распределение
+                        fields['rating'] = self.rng.choices((1, 2, 3, 4, 5), weights=(5, 7, 18, 35, 35))[0]
+                        fields['comment'] = ''
+                    yield model(**fields)
+
+        self.stdout.write(f'{label.capitalize()}: {self._bulk(model, pairs())}')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from library.cache_warmup import warm_caches
+
+
+class Command(BaseCommand):
+    help = ('Прогревает кеш фрагментов (карточки, блоки тем) и статистику тем. '
+            'Имеет смысл при общем для процессов бэкенде кеша (Redis, Memcached, файловый, БД)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--topics', type=int, default=None,
+                            help='Сколько страниц тем прогреть (по умолчанию все)')
+
+    def handle(self, *args, **options):
+        pages = warm_caches(topic_limit=options['topics'])
+        self.stdout.write(self.style.SUCCESS(f'Прогрето страниц: {pages}'))
@@ -0,0 +1,131 @@
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header
+
+from .storage import is_hashed_name
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def file_etag(name, stat):
+    # У файлов из ContentAddressedStorage имя и есть sha256 содержимого — сильный ETag
+    # без чтения файла; для старых имен берем время изменения и размер, как nginx
+    if is_hashed_name(name):
+        return '"%s"' % os.path.splitext(os.path.basename(name))[0]
+    return '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+
+
+def parse_range(header, size):
+    """Разбирает заголовок Range для одного диапазона.
+
+    Возвращает (start, end) включительно, None — если заголовок нужно
+    проигнорировать и отдать файл целиком, и False — если диапазон
+    невыполним (416).
+    """
+    match = RANGE_RE.match(header.strip().replace(' ', ''))
+    if match is None:
+        # Несколько диапазонов или чужие единицы: по RFC 9110 можно отдать весь файл
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-500 — последние 500 байт
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _offload(name, path):
+    backend = getattr(settings, 'MEDIA_SENDFILE', None)
+    if backend == 'x-sendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = path
+        return response
+    if backend == 'x-accel-redirect':
+        response = HttpResponse()
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + name.replace(os.sep, '/')
+        return response
+    return None
+
+
+def serve_file(request, storage, name, filename=None, as_attachment=False, cache_control='private, no-cache'):
+    """Отдает файл из storage с поддержкой Range, ETag и условных запросов.
+
+    Если настроен MEDIA_SENDFILE ('x-sendfile' для Apache/lighttpd или
+    'x-accel-redirect' для nginx), сами байты отдает прокси, а Django только
+    проверяет права и заголовки. Иначе файл стримится через FileResponse.
+    """
+    try:
+        path = storage.path(name)
+        stat = os.stat(path)
+    except (NotImplementedError, OSError, ValueError):
+        raise Http404('Файл не найден')
+
+    etag = file_etag(name, stat)
+    last_modified = int(stat.st_mtime)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(filename or name)
+    if content_type is None or encoding:
+        # .gz и подобные отдаем как есть, без Content-Encoding — иначе браузер распакует их сам
+        content_type = 'application/octet-stream'
+
+    response = _offload(name, path)
+    if response is None:
+        byte_range = None
+        range_header = request.headers.get('Range')
+        # If-Range: диапазон действует, только если у клиента та же версия файла
+        if range_header and request.headers.get('If-Range', etag) == etag:
+            byte_range = parse_range(range_header, stat.st_size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        if byte_range is not None:
+            start, end = byte_range
+            response = StreamingHttpResponse(_read_range(path, start, end - start + 1), status=206)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            # FileResponse отдает файл через wsgi.file_wrapper (sendfile), если сервер умеет
+            response = FileResponse(open(path, 'rb'))
+            response['Content-Length'] = str(stat.st_size)
+
+    response['Content-Type'] = content_type
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = formatdate(last_modified, usegmt=True)
+    response['Cache-Control'] = cache_control
+    disposition = content_disposition_header(as_attachment, filename or os.path.basename(name))
+    if disposition:
+        response['Content-Disposition'] = disposition
+    return response
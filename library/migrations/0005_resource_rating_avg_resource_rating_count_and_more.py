@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:43
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_stats(apps, schema_editor):
+    Rating = apps.get_model('library', 'Rating')
+    Resource = apps.get_model('library', 'Resource')
+    stats = Rating.objects.order_by().values('resource').annotate(count=Count('id'), total=Sum('rating'))
+    for row in stats.iterator():
+        Resource.objects.filter(pk=row['resource']).update(
+            rating_count=row['count'],
+            rating_sum=row['total'],
+            rating_avg=row['total'] / row['count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_delete_registrationkey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resource',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок'),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['-rating_avg', '-rating_count'], name='resource_popular_idx'),
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
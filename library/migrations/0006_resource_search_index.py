@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:05
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from library import search
+
+    Resource = apps.get_model('library', 'Resource')
+    search.rebuild_index(Resource.objects.all())
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from library import search
+
+    schema_editor.execute(f'DROP TABLE IF EXISTS {search.FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_resource_rating_avg_resource_rating_count_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0006_resource_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resource',
+            name='external_id',
+            field=models.CharField(blank=True, editable=False, max_length=100, null=True, unique=True, verbose_name='Внешний ID'),
+        ),
+    ]
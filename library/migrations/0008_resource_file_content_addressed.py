@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:04
+
+from django.db import migrations, models
+import library.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_resource_external_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='resource',
+            name='file',
+            field=models.FileField(blank=True, db_index=True, null=True, storage=library.storage.ContentAddressedStorage(), upload_to='resources/', verbose_name='Файл'),
+        ),
+    ]
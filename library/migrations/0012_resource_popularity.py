@@ -0,0 +1,64 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:33
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+# Формула ResourcePopularity.score_of на момент миграции
+PRIOR_VOTES = 10
+BOOKMARK_RATING = 5
+BOOKMARK_WEIGHT = 0.5
+DEFAULT_MEAN = 3.0
+
+
+def backfill_popularity(apps, schema_editor):
+    Bookmark = apps.get_model('library', 'Bookmark')
+    Resource = apps.get_model('library', 'Resource')
+    ResourcePopularity = apps.get_model('library', 'ResourcePopularity')
+    totals = Resource.objects.aggregate(count=Sum('rating_count'), total=Sum('rating_sum'))
+    mean = totals['total'] / totals['count'] if totals['count'] else DEFAULT_MEAN
+    bookmarks = dict(
+        Bookmark.objects.order_by().values_list('resource_id').annotate(count=Count('id'))
+    )
+    rows = []
+    for pk, count, total in Resource.objects.values_list('pk', 'rating_count', 'rating_sum').iterator():
+        marks = bookmarks.get(pk, 0)
+        votes = count + marks * BOOKMARK_WEIGHT + PRIOR_VOTES
+        score = (total + marks * BOOKMARK_WEIGHT * BOOKMARK_RATING + PRIOR_VOTES * mean) / votes
+        rows.append(ResourcePopularity(
+            resource_id=pk, rating_count=count, rating_sum=total, bookmark_count=marks, score=score,
+        ))
+    ResourcePopularity.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0011_similar_resources'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourcePopularity',
+            fields=[
+                ('resource', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='library.resource', verbose_name='Материал')),
+                ('rating_count', models.PositiveIntegerField(default=0, verbose_name='Количество оценок')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('bookmark_count', models.PositiveIntegerField(default=0, verbose_name='В избранном')),
+                ('score', models.FloatField(default=0, verbose_name='Популярность')),
+            ],
+            options={
+                'verbose_name': 'Популярность материала',
+                'verbose_name_plural': 'Популярность материалов',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='resource',
+            name='resource_popular_idx',
+        ),
+        migrations.AddIndex(
+            model_name='resourcepopularity',
+            index=models.Index(fields=['-score', '-resource'], name='popularity_score_idx'),
+        ),
+        migrations.RunPython(backfill_popularity, migrations.RunPython.noop),
+    ]
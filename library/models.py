@@ -3,11 +3,20 @@ import string
 from datetime import timedelta
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models import (
+    Case, Count, ExpressionWrapper, F, FloatField, IntegerField, OuterRef, Prefetch, Subquery, Sum, Value, When,
+)
+from django.db.models.expressions import Combinable
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.core.cache import cache
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
+from . import thumbnails
+from .storage import ContentAddressedStorage
+
 class Topic(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name="Название")
     description = models.TextField(blank=True, null=True, verbose_name="Описание")
@@ -32,6 +41,28 @@ class Topic(models.Model):
         return self.resources.exists()
 
 
+class ResourceQuerySet(models.QuerySet):
+    def for_cards(self):
+        # Все, что выводит карточка материала, за постоянное число запросов:
+        # автор через JOIN, темы одним prefetch, оценки — денормализованные поля
+        topic_count = ResourceTopic.objects.filter(resource=OuterRef('pk')).order_by().values('resource').annotate(
+            count=Count('id')
+        ).values('count')
+        return self.select_related('author').prefetch_related(
+            Prefetch('topics', queryset=Topic.objects.only('id', 'name'))
+        ).annotate(
+            topic_count=Coalesce(Subquery(topic_count, output_field=IntegerField()), Value(0))
+        )
+
+    def popular(self):
+        # INNER JOIN с таблицей рейтинга. Сортировать нужно по ее столбцам (score, resource_id),
+        # а не по library_resource.id — тогда SQLite идет по индексу popularity_score_idx без
+        # сортировки; аннотации нужны и KeysetPaginator для курсора
+        return self.filter(popularity__isnull=False).annotate(
+            popularity_score=F('popularity__score'), popularity_id=F('popularity__resource_id'),
+        )
+
+
 class Resource(models.Model):
     TYPE_CHOICES = [
         ('pdf', 'PDF документ'),
@@ -52,6 +83,8 @@ class Resource(models.Model):
     url = models.URLField(blank=True, verbose_name='URL')
     file = models.FileField(
         upload_to='resources/',
+        storage=ContentAddressedStorage(),
+        db_index=True,
         blank=True,
         null=True,
         verbose_name='Файл'
@@ -69,15 +102,78 @@ class Resource(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+    external_id = models.CharField(
+        max_length=100,
+        unique=True,
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name='Внешний ID'
+    )
+
+    rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок')
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок')
+    rating_avg = models.FloatField(default=0, editable=False, verbose_name='Средняя оценка')
+
+    objects = ResourceQuerySet.as_manager()
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Имя файла на момент загрузки: после замены или очистки старый файл освобождается
+        instance._loaded_file = instance.__dict__.get('file')
+        return instance
+
+    @classmethod
+    def release_file(cls, name):
+        """Удаляет файл вместе с последней ссылкой на него (одинаковые загрузки делят один файл).
+
+        Возвращает False, если файл недавно использовали снова и ссылку на него
+        еще может добавить незакоммиченная загрузка, — тогда проверить позже.
+        """
+        if not name or cls.objects.filter(file=name).exists():
+            return True
+        if not cls._meta.get_field('file').storage.delete_unused(name):
+            return False
+        thumbnails.delete(name)
+        return True
+
     def average_rating(self):
-        ratings = self.ratings.all()
-        if ratings:
-            return sum(r.rating for r in ratings) / len(ratings)
-        return 0
+        return self.rating_avg
+
+    @classmethod
+    def apply_rating_delta(cls, resource_id, count_delta, sum_delta):
+        ResourcePopularity.apply_delta(resource_id, rating_count=count_delta, rating_sum=sum_delta)
+        # Одним UPDATE: все выражения в SET видят старые значения строки
+        new_count = F('rating_count') + count_delta
+        return cls.objects.filter(pk=resource_id).update(
+            rating_count=new_count,
+            rating_sum=F('rating_sum') + sum_delta,
+            rating_avg=Case(
+                When(rating_count__gt=-count_delta, then=ExpressionWrapper(
+                    (F('rating_sum') + sum_delta) * 1.0 / new_count,
+                    output_field=FloatField()
+                )),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+        )
+
+    def refresh_rating_stats(self, save=True):
+        stats = self.ratings.aggregate(count=models.Count('id'), total=models.Sum('rating'))
+        self.rating_count = stats['count'] or 0
+        self.rating_sum = stats['total'] or 0
+        self.rating_avg = self.rating_sum / self.rating_count if self.rating_count else 0
+        if save:
+            type(self).objects.filter(pk=self.pk).update(
+                rating_count=self.rating_count,
+                rating_sum=self.rating_sum,
+                rating_avg=self.rating_avg,
+            )
+            ResourcePopularity.refresh([self.pk])
 
     def can_edit(self, user):
         if not user.is_authenticated:
@@ -93,6 +189,14 @@ class Resource(models.Model):
         verbose_name = 'Материал'
         verbose_name_plural = 'Материалы'
         ordering = ['-created_at']
+        indexes = [
+            # Ленты материалов: ORDER BY created_at DESC, id DESC с курсором (KeysetPaginator)
+            # и диапазоны дат в фильтре списка
+            models.Index(fields=['-created_at', '-id'], name='resource_created_idx'),
+            models.Index(fields=['resource_type', '-created_at', '-id'], name='resource_type_created_idx'),
+            # Материалы автора в профиле
+            models.Index(fields=['author', '-created_at'], name='resource_author_created_idx'),
+        ]
 
     @property
     def can_be_edited_by(self):
@@ -114,6 +218,10 @@ class ResourceTopic(models.Model):
         unique_together = ['resource', 'topic']
         verbose_name = 'Связь материал-тема'
         verbose_name_plural = 'Связи материал-тема'
+        indexes = [
+            # Уникальный индекс начинается с resource; страница темы идет от topic
+            models.Index(fields=['topic', 'resource'], name='resourcetopic_topic_idx'),
+        ]
 
 
 class Rating(models.Model):
@@ -141,10 +249,37 @@ class Rating(models.Model):
         verbose_name = 'Оценка'
         verbose_name_plural = 'Оценки'
         ordering = ['-created_at']
+        indexes = [
+            # Отзывы на странице материала и оценки в профиле — в порядке ordering
+            models.Index(fields=['resource', '-created_at'], name='rating_resource_created_idx'),
+            models.Index(fields=['user', '-created_at'], name='rating_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user} - {self.resource}: {self.rating}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rating = (instance.__dict__.get('resource_id'), instance.__dict__.get('rating'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        loaded = getattr(self, '_loaded_rating', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                Resource.apply_rating_delta(self.resource_id, 1, self.rating)
+            elif loaded is None or loaded[1] is None:
+                self.resource.refresh_rating_stats()
+            elif loaded[0] != self.resource_id:
+                Resource.apply_rating_delta(loaded[0], -1, -loaded[1])
+                Resource.apply_rating_delta(self.resource_id, 1, self.rating)
+            elif loaded[1] != self.rating:
+                Resource.apply_rating_delta(self.resource_id, 0, self.rating - loaded[1])
+        self._loaded_rating = (self.resource_id, self.rating)
+
 
 class Bookmark(models.Model):
     user = models.ForeignKey(
@@ -166,6 +301,187 @@ class Bookmark(models.Model):
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='bookmark_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user} -> {self.resource}"
+
+
+class ResourcePopularity(models.Model):
+    """Материализованный рейтинг популярности: одна строка на материал.
+
+    score — байесовское среднее: к оценкам материала добавляется PRIOR_VOTES
+    «виртуальных» оценок, равных средней по всей библиотеке, поэтому одна
+    пятерка не обгоняет двести оценок со средним 4.8. Закладка считается
+    неявной оценкой BOOKMARK_RATING с весом BOOKMARK_WEIGHT. Счетчики
+    продублированы здесь, чтобы каждое изменение пересчитывало score одним
+    UPDATE этой строки (apply_delta); средняя по библиотеке обновляется при
+    полном пересчете (refresh() без аргументов, manage.py rebuild_popularity).
+    """
+
+    PRIOR_VOTES = 10
+    BOOKMARK_RATING = 5
+    BOOKMARK_WEIGHT = 0.5
+    DEFAULT_MEAN = 3.0
+    PRIOR_CACHE_KEY = 'library:popularity:prior'
+    REFRESH_BATCH = 1000
+
+    resource = models.OneToOneField(
+        Resource, on_delete=models.CASCADE, primary_key=True, related_name='popularity', verbose_name='Материал'
+    )
+    rating_count = models.PositiveIntegerField(default=0, verbose_name='Количество оценок')
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')
+    bookmark_count = models.PositiveIntegerField(default=0, verbose_name='В избранном')
+    score = models.FloatField(default=0, verbose_name='Популярность')
+
+    class Meta:
+        verbose_name = 'Популярность материала'
+        verbose_name_plural = 'Популярность материалов'
+        indexes = [
+            models.Index(fields=['-score', '-resource'], name='popularity_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.resource_id}: {self.score:.3f}'
+
+    @classmethod
+    def score_of(cls, rating_count, rating_sum, bookmark_count, mean):
+        # Работает и с числами, и с выражениями F() для UPDATE
+        votes = rating_count + bookmark_count * cls.BOOKMARK_WEIGHT + cls.PRIOR_VOTES
+        total = rating_sum + bookmark_count * (cls.BOOKMARK_WEIGHT * cls.BOOKMARK_RATING) + cls.PRIOR_VOTES * mean
+        if isinstance(votes, Combinable) or isinstance(total, Combinable):
+            return ExpressionWrapper(total / votes, output_field=FloatField())
+        return total / votes
+
+    @classmethod
+    def prior_mean(cls):
+        mean = cache.get(cls.PRIOR_CACHE_KEY)
+        if mean is None:
+            mean = cls._library_mean()
+            cache.set(cls.PRIOR_CACHE_KEY, mean, None)
+        return mean
+
+    @staticmethod
+    def _library_mean():
+        totals = Resource.objects.aggregate(count=Sum('rating_count'), total=Sum('rating_sum'))
+        if not totals['count']:
+            return ResourcePopularity.DEFAULT_MEAN
+        return totals['total'] / totals['count']
+
+    @classmethod
+    def apply_delta(cls, resource_id, rating_count=0, rating_sum=0, bookmark_count=0):
+        # Как Resource.apply_rating_delta: новые счетчики и score одним UPDATE. Строки может
+        # не быть, если материал удаляется каскадом, — тогда пересоздавать ее нельзя
+        counts = {
+            'rating_count': F('rating_count') + rating_count,
+            'rating_sum': F('rating_sum') + rating_sum,
+            'bookmark_count': F('bookmark_count') + bookmark_count,
+        }
+        return cls.objects.filter(resource_id=resource_id).update(
+            score=cls.score_of(*counts.values(), cls.prior_mean()), **counts
+        )
+
+    @classmethod
+    def refresh(cls, resource_ids=None):
+        """Пересчитывает строки из Resource и Bookmark и возвращает их число.
+
+        Без аргументов — все материалы, заодно со средней по библиотеке. С id —
+        только эти материалы (новые, созданные bulk_create без сигналов, и т.п.).
+        """
+        if resource_ids is None:
+            mean = cls._library_mean()
+            cache.set(cls.PRIOR_CACHE_KEY, mean, None)
+        else:
+            mean = cls.prior_mean()
+        resources = Resource.objects.order_by('pk')
+        if resource_ids is not None:
+            resources = resources.filter(pk__in=list(resource_ids))
+
+        updated = 0
+        last_pk = 0
+        while True:
+            batch = list(resources.filter(pk__gt=last_pk).values_list('pk', 'rating_count', 'rating_sum')[
+                :cls.REFRESH_BATCH
+            ])
+            if not batch:
+                break
+            bookmarks = dict(
+                Bookmark.objects.filter(resource_id__in=[pk for pk, _, _ in batch]).order_by()
+                .values_list('resource_id').annotate(count=Count('id'))
+            )
+            rows = [
+                cls(resource_id=pk, rating_count=count, rating_sum=total, bookmark_count=bookmarks.get(pk, 0),
+                    score=cls.score_of(count, total, bookmarks.get(pk, 0), mean))
+                for pk, count, total in batch
+            ]
+            with transaction.atomic():
+                cls.objects.bulk_create(
+                    rows, update_conflicts=True, unique_fields=['resource'],
+                    update_fields=['rating_count', 'rating_sum', 'bookmark_count', 'score'],
+                )
+            updated += len(rows)
+            last_pk = batch[-1][0]
+        return updated
+
+
+class SimilarResource(models.Model):
+    """Заранее подобранный похожий материал; строит library/similar.py."""
+
+    # Отдельный индекс по resource не нужен: его покрывает уникальный (resource, rank),
+    # он же — выборка для страницы материала. Индекс по similar остается: по нему
+    # ищутся списки, которые затрагивает изменение материала
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='similar_links', db_index=False)
+    similar = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField(verbose_name='Место')
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        unique_together = ['resource', 'rank']
+        ordering = ['resource', 'rank']
+        verbose_name = 'Похожий материал'
+        verbose_name_plural = 'Похожие материалы'
+
+    def __str__(self):
+        return f'{self.resource_id} -> {self.similar_id} ({self.score:.3f})'
+
+
+class Job(models.Model):
+    """Фоновая задача в очереди; выполняет manage.py run_jobs (см. library/jobs.py)."""
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Выполнена'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    name = models.CharField(max_length=100, verbose_name='Задача')
+    args = models.JSONField(default=list, blank=True, verbose_name='Аргументы')
+    kwargs = models.JSONField(default=dict, blank=True, verbose_name='Именованные аргументы')
+    priority = models.SmallIntegerField(default=0, verbose_name='Приоритет')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, verbose_name='Статус')
+    run_at = models.DateTimeField(default=timezone.now, verbose_name='Запустить не раньше')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')
+    max_attempts = models.PositiveSmallIntegerField(default=5, verbose_name='Максимум попыток')
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name='Обработчик')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Взята в работу')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создана')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Завершена')
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            # Выборка следующей задачи: WHERE status = 'queued' AND run_at <= now ORDER BY priority DESC, run_at
+            models.Index(fields=['status', '-priority', 'run_at'], name='library_job_ready_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.get_status_display()})'
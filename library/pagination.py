@@ -0,0 +1,143 @@
+from functools import cached_property
+
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_SALT = 'library.pagination'
+
+
+def _encode_value(value):
+    if hasattr(value, 'isoformat'):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return parse_datetime(value['dt'])
+    return value
+
+
+class KeysetPage:
+    def __init__(self, paginator, object_list, has_next, has_previous):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        return self.paginator.make_cursor(self.object_list[-1], 'next')
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous:
+            return None
+        return self.paginator.make_cursor(self.object_list[0], 'prev')
+
+
+class KeysetPaginator:
+    """Постраничный вывод по ключу сортировки вместо OFFSET.
+
+    Курсор — подписанная строка со значениями полей сортировки последней
+    (или первой) записи страницы, поэтому любая страница стоит как первая.
+    Точное число записей не считается: count ограничен count_limit.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-pk'), count_limit=1000):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.count_limit = count_limit
+
+    @property
+    def fields(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def make_cursor(self, obj, direction):
+        values = [_encode_value(getattr(obj, field)) for field in self.fields]
+        return signing.dumps({'v': values, 'd': direction}, salt=CURSOR_SALT, compress=True)
+
+    def _parse_cursor(self, cursor):
+        if not cursor:
+            return None, 'next'
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+            values = [_decode_value(value) for value in data['v']]
+            direction = data['d']
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            return None, 'next'
+        if len(values) != len(self.ordering) or direction not in ('next', 'prev'):
+            return None, 'next'
+        return values, direction
+
+    def _after(self, values, reverse=False):
+        # (a, b) "после" (x, y) при сортировке по убыванию: a < x OR (a = x AND b < y)
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _reversed_ordering(self):
+        return [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+
+    def _page_query(self, cursor):
+        values, direction = self._parse_cursor(cursor)
+        queryset = self.queryset
+        if direction == 'prev':
+            queryset = queryset.filter(self._after(values, reverse=True)).order_by(*self._reversed_ordering())
+        else:
+            if values is not None:
+                queryset = queryset.filter(self._after(values))
+            queryset = queryset.order_by(*self.ordering)
+        return queryset[:self.per_page + 1], values, direction
+
+    def _make_page(self, rows, values, direction):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'prev':
+            rows.reverse()
+            return KeysetPage(self, rows, has_next=True, has_previous=has_more)
+        return KeysetPage(self, rows, has_next=has_more, has_previous=values is not None)
+
+    def get_page(self, cursor=None):
+        queryset, values, direction = self._page_query(cursor)
+        return self._make_page(list(queryset), values, direction)
+
+    async def aget_page(self, cursor=None):
+        queryset, values, direction = self._page_query(cursor)
+        return self._make_page([obj async for obj in queryset], values, direction)
+
+    @cached_property
+    def count(self):
+        return self.queryset.order_by().values('pk')[:self.count_limit + 1].count()
+
+    @property
+    def count_is_estimate(self):
+        return self.count > self.count_limit
+
+    @property
+    def display_count(self):
+        if self.count_is_estimate:
+            return f'{self.count_limit}+'
+        return self.count
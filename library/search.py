@@ -0,0 +1,239 @@
+import re
+
+from django.db import connection
+from django.db.models import FloatField, IntegerField, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'library_resource_fts'
+ORDERING = ('search_rank', '-created_at', '-pk')
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND_1 = ('вшись', 'вши', 'в')
+PERFECTIVE_GERUND_2 = ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв')
+REFLEXIVE = ('ся', 'сь')
+ADJECTIVE = (
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой',
+    'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')
+PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+VERB_1 = ('ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'й', 'л', 'н')
+VERB_2 = (
+    'ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило', 'ыло', 'ено', 'ует', 'уют',
+    'ены', 'ить', 'ыть', 'ишь', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ят', 'ит', 'ыт', 'ую', 'ю',
+)
+NOUN = (
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие', 'ье', 'еи', 'ии', 'ей', 'ой',
+    'ий', 'ям', 'ем', 'ам', 'ом', 'ах', 'ях', 'ию', 'ью', 'ия', 'ья', 'а', 'е', 'и', 'й', 'о', 'у',
+    'ы', 'ь', 'ю', 'я',
+)
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+
+def _regions(word):
+    rv = r1 = r2 = len(word)
+    for i, ch in enumerate(word):
+        if ch in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r1, r2
+
+
+def _strip(word, start, endings, preceded_by=None):
+    for ending in sorted(endings, key=len, reverse=True):
+        if not word.endswith(ending) or len(word) - len(ending) < start:
+            continue
+        if preceded_by is not None:
+            pos = len(word) - len(ending) - 1
+            if pos < start or word[pos] not in preceded_by:
+                continue
+        return word[:-len(ending)]
+    return None
+
+
+def _strip_group(word, start, group1, group2):
+    # Окончания первой группы должны идти после «а» или «я», которые остаются в основе
+    candidates = [c for c in (
+        _strip(word, start, group1, preceded_by='ая'),
+        _strip(word, start, group2),
+    ) if c is not None]
+    return min(candidates, key=len) if candidates else None
+
+
+def stem(word):
+    """Стеммер Snowball для русского языка. Латиница возвращается без изменений."""
+    word = word.lower().replace('ё', 'е')
+    if not any(ch in VOWELS for ch in word):
+        return word
+
+    rv, _, r2 = _regions(word)
+
+    stripped = _strip_group(word, rv, PERFECTIVE_GERUND_1, PERFECTIVE_GERUND_2)
+    if stripped is not None:
+        word = stripped
+    else:
+        word = _strip(word, rv, REFLEXIVE) or word
+        stripped = _strip(word, rv, ADJECTIVE)
+        if stripped is not None:
+            word = _strip_group(stripped, rv, PARTICIPLE_1, PARTICIPLE_2) or stripped
+        else:
+            stripped = _strip_group(word, rv, VERB_1, VERB_2)
+            if stripped is None:
+                stripped = _strip(word, rv, NOUN)
+            if stripped is not None:
+                word = stripped
+
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    word = _strip(word, r2, DERIVATIONAL) or word
+
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        word = word[:-1]
+    else:
+        stripped = _strip(word, rv, SUPERLATIVE)
+        if stripped is not None:
+            word = stripped
+            if word.endswith('нн') and len(word) - 2 >= rv:
+                word = word[:-1]
+        elif word.endswith('ь') and len(word) - 1 >= rv:
+            word = word[:-1]
+
+    return word
+
+
+def tokenize(text):
+    """Разбивает текст на слова с Unicode-приведением регистра (в т.ч. кириллицы) и стеммингом."""
+    return [stem(token) for token in WORD_RE.findall((text or '').casefold())]
+
+
+def _document(text):
+    return ' '.join(tokenize(text))
+
+
+_index_ready = False
+
+
+def is_available():
+    global _index_ready
+    if _index_ready:
+        return True
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        _index_ready = cursor.fetchone() is not None
+    return _index_ready
+
+
+def create_index(cursor):
+    cursor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+        f'USING fts5(title, description, tokenize="unicode61")'
+    )
+
+
+def index_resource(resource):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [resource.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)',
+            [resource.pk, _document(resource.title), _document(resource.description)]
+        )
+
+
+def index_resources(resources):
+    # Пакетный вариант index_resource для импорта: bulk_create не вызывает post_save
+    if not is_available():
+        return
+    rows = [(resource.pk, _document(resource.title), _document(resource.description)) for resource in resources]
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)', rows)
+
+
+def remove_resource(resource_id):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [resource_id])
+
+
+def rebuild_index(resources, batch_size=2000):
+    with connection.cursor() as cursor:
+        create_index(cursor)
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        rows = resources.order_by().values_list('pk', 'title', 'description')
+        batch = []
+        total = 0
+        for pk, title, description in rows.iterator(chunk_size=batch_size):
+            batch.append((pk, _document(title), _document(description)))
+            if len(batch) >= batch_size:
+                cursor.executemany(
+                    f'INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)', batch
+                )
+                total += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)', batch
+            )
+            total += len(batch)
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+def match_expression(query):
+    terms = tokenize(query)
+    # Каждое слово в кавычках: пользовательский ввод не интерпретируется как синтаксис FTS5
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_resources(queryset, query):
+    """Фильтрует queryset по запросу и сортирует по релевантности.
+
+    Таблица FTS5 присоединяется к запросу по rowid, а релевантность — ее
+    столбец rank (bm25 с весами полей), поэтому фильтры ORM и курсор
+    пагинатора работают со всеми совпадениями, а не с заранее отобранными.
+    Если индекс недоступен (не SQLite или не выполнена миграция),
+    используется прежний поиск через icontains.
+    """
+    if not is_available():
+        return queryset.filter(
+            Q(title__icontains=query) | Q(description__icontains=query)
+        ).annotate(search_rank=Value(0, output_field=IntegerField()))
+
+    match = match_expression(query)
+    if not match:
+        # Аннотация нужна и пустому результату: по search_rank потом сортирует пагинатор
+        return queryset.none().annotate(search_rank=Value(0, output_field=IntegerField()))
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[
+            f'{FTS_TABLE}.rowid = {table}.id',
+            f'{FTS_TABLE} MATCH %s',
+            # Переопределение rank на время запроса: bm25 с весами названия и описания
+            f'{FTS_TABLE}.rank MATCH %s',
+        ],
+        params=[match, f'bm25({TITLE_WEIGHT}, {DESCRIPTION_WEIGHT})'],
+    ).annotate(
+        # bm25 отрицательный: чем меньше, тем релевантнее
+        search_rank=RawSQL(f'{FTS_TABLE}.rank', [], output_field=FloatField()),
+    ).order_by(*ORDERING)
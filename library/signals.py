@@ -0,0 +1,127 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import jobs, search, similar, thumbnails
+from .cache_versions import bump, model_key
+from .models import Bookmark, Rating, Resource, ResourcePopularity, ResourceTopic, Topic
+from .stats import invalidate_topic_stats
+
+TOPICS_GROUP = 'topics'
+
+
+def _bump_resources(resource_ids):
+    bump(*[model_key(Resource, resource_id) for resource_id in resource_ids])
+
+
+@receiver(post_save, sender=Rating)
+def rating_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _bump_resources([instance.resource_id])
+        similar.schedule([instance.resource_id])
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    # Срабатывает и при каскадном удалении (например, вместе с пользователем),
+    # внутри транзакции Collector.delete()
+    Resource.apply_rating_delta(instance.resource_id, -1, -instance.rating)
+    _bump_resources([instance.resource_id])
+    similar.schedule([instance.resource_id])
+
+
+def _release_file_later(name):
+    # Задача в очереди видна обработчику только после коммита: до него откат
+    # вернул бы удаленный файл в запись
+    if name:
+        jobs.enqueue('library.release_file', args=[name])
+
+
+@receiver(post_save, sender=Bookmark)
+def bookmark_saved(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        ResourcePopularity.apply_delta(instance.resource_id, bookmark_count=1)
+
+
+@receiver(post_delete, sender=Bookmark)
+def bookmark_deleted(sender, instance, **kwargs):
+    ResourcePopularity.apply_delta(instance.resource_id, bookmark_count=-1)
+
+
+@receiver(post_save, sender=Resource)
+def resource_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_resource(instance)
+    bump(instance)
+    if kwargs.get('created'):
+        ResourcePopularity.refresh([instance.pk])
+    if 'file' in instance.__dict__:  # при only()/defer() файл не загружен и не менялся
+        loaded_file = getattr(instance, '_loaded_file', None)
+        if loaded_file and loaded_file != instance.file.name:
+            _release_file_later(loaded_file)
+        if (instance.file and loaded_file != instance.file.name and thumbnails.can_preview(instance.file.name)
+                and thumbnails.claim(instance.file.name)):
+            # Превью готовится заранее, чтобы первый посетитель карточки уже его увидел
+            jobs.enqueue(
+                'library.generate_thumbnails',
+                args=[instance.file.name, [model_key(Resource, instance.pk)]],
+            )
+        instance._loaded_file = instance.file.name
+    if not kwargs.get('created'):
+        # Тип или автор могли измениться — статистика всех тем материала устарела
+        invalidate_topic_stats(
+            ResourceTopic.objects.filter(resource=instance).values_list('topic_id', flat=True)
+        )
+
+
+@receiver(post_delete, sender=Resource)
+def resource_deleted(sender, instance, **kwargs):
+    search.remove_resource(instance.pk)
+    bump(instance)
+    if 'file' in instance.__dict__:
+        _release_file_later(instance.file.name)
+
+
+@receiver(post_save, sender=Topic)
+def topic_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump(TOPICS_GROUP)
+    if not kwargs.get('created'):
+        # Название темы выводится в карточках материалов
+        _bump_resources(ResourceTopic.objects.filter(topic=instance).values_list('resource_id', flat=True))
+
+
+@receiver(post_delete, sender=Topic)
+def topic_deleted(sender, instance, **kwargs):
+    bump(TOPICS_GROUP)
+
+
+@receiver(post_save, sender=ResourceTopic)
+@receiver(post_delete, sender=ResourceTopic)
+def resource_topic_changed(sender, instance, **kwargs):
+    invalidate_topic_stats([instance.topic_id])
+    _bump_resources([instance.resource_id])
+    bump(TOPICS_GROUP)
+    similar.schedule([instance.resource_id])
+
+
+@receiver(m2m_changed, sender=Resource.topics.through)
+def resource_topics_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # form.save_m2m() и topics.set() создают связи через bulk_create, без post_save
+    if action == 'pre_clear':
+        if reverse:
+            topic_ids = [instance.pk]
+            resource_ids = list(instance.resource_set.values_list('pk', flat=True))
+        else:
+            topic_ids = list(instance.topics.values_list('pk', flat=True))
+            resource_ids = [instance.pk]
+    elif action in ('post_add', 'post_remove'):
+        topic_ids = [instance.pk] if reverse else list(pk_set or [])
+        resource_ids = list(pk_set or []) if reverse else [instance.pk]
+    else:
+        return
+    invalidate_topic_stats(topic_ids)
+    _bump_resources(resource_ids)
+    bump(TOPICS_GROUP)
+    similar.schedule(resource_ids)
@@ -0,0 +1,359 @@
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Avg, Count
+
+from . import jobs
+from .models import Job, Rating, Resource, ResourceTopic, SimilarResource
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+TASK = 'library.refresh_similar'
+TOP_K = 8
+TOPIC_WEIGHT = 0.6          # доля сходства по темам, остальное — по оценкам
+MIN_SCORE = 0.05            # слабее — уже не «похожий», а случайный сосед
+# Признак у большего числа материалов — «хаб» (тема на десятки тысяч материалов):
+# в кандидаты от него идут только MAX_POSTINGS самых новых, иначе число пар растет квадратично
+MAX_POSTINGS = 500
+PAIR_BUDGET = 1_000_000     # пар (строка блока, кандидат) на блок, ~50 МБ временных массивов
+MAX_BLOCK = 512
+FULL_REBUILD_SHARE = 0.5    # задето больше этой доли материалов — пересчитываем все
+MAX_PENDING_IDS = 5000
+MERGE_ATTEMPTS = 3
+REFRESH_DELAY = 60          # секунд: правки за это время собираются в одну задачу
+WRITE_BATCH = 500
+
+
+def available():
+    return np is not None
+
+
+def _ranges(starts, ends):
+    """Склеенные arange(starts[i], ends[i]) без цикла Python."""
+    lengths = ends - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+def _floors(resource_ids, cols, width):
+    """Для каждого признака — наименьший id материала в его окне кандидатов (0 — окно не урезано)."""
+    order = np.lexsort((-resource_ids, cols))
+    counts = np.bincount(cols, minlength=width)
+    starts = np.cumsum(counts) - counts
+    floors = np.zeros(width, dtype=np.int64)
+    hubs = counts > MAX_POSTINGS
+    floors[hubs] = resource_ids[order][starts[hubs] + MAX_POSTINGS - 1]
+    return floors
+
+
+class Features:
+    """Разреженная матрица «материал × признак» на массивах NumPy: CSR по строкам и CSC по признакам.
+
+    Признаки — темы (с весом IDF: редкая общая тема говорит о сходстве больше
+    частой) и пользователи (оценка минус средняя оценка этого пользователя,
+    скорректированный косинус). Обе части строки нормируются отдельно и
+    умножаются на корень из своей доли, поэтому скалярное произведение двух
+    строк — взвешенная сумма косинусов по темам и по оценкам.
+
+    floors — для каждого признака наименьший id материала, который от него
+    попадает в кандидаты: у хабов это MAX_POSTINGS-й с конца, у остальных 0.
+    """
+
+    def __init__(self, resource_ids, rows, cols, values, width, floors):
+        order = np.argsort(rows, kind='stable')
+        self.resource_ids = resource_ids
+        self.rows = rows[order]
+        self.cols = cols[order]
+        self.values = values[order].astype(np.float32)
+        self.width = width
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(self.rows, minlength=len(resource_ids)))))
+
+        # Инвертированный индекс: строки каждого признака по возрастанию id материала
+        by_column = np.lexsort((self.rows, self.cols))
+        self.column_rows = self.rows[by_column]
+        self.column_values = self.values[by_column]
+        column_cols = self.cols[by_column]
+        counts = np.bincount(self.cols, minlength=width)
+        self.column_ends = np.cumsum(counts)
+        below = self.resource_ids[self.column_rows] < floors[column_cols]
+        self.column_starts = self.column_ends - counts + np.bincount(column_cols[below], minlength=width)
+
+    def __len__(self):
+        return len(self.resource_ids)
+
+    @classmethod
+    def load(cls):
+        """Все материалы — для полного пересчета."""
+        resource_ids = np.fromiter(Resource.objects.order_by('pk').values_list('pk', flat=True), dtype=np.int64)
+        links = _array(ResourceTopic.objects.values_list('resource_id', 'topic_id'), 2)
+        ratings = _array(Rating.objects.values_list('resource_id', 'user_id', 'rating'), 3)
+        # Между запросами материал могли удалить — его связи и оценки отбрасываем
+        links = links[np.isin(links[:, 0], resource_ids)]
+        ratings = ratings[np.isin(ratings[:, 0], resource_ids)]
+
+        def topic_stats(topic_ids, topic_cols):
+            return np.bincount(topic_cols, minlength=len(topic_ids)), _floors(links[:, 0], topic_cols, len(topic_ids))
+
+        def user_stats(user_ids, user_cols):
+            mean = (np.bincount(user_cols, weights=ratings[:, 2], minlength=len(user_ids))
+                    / np.maximum(np.bincount(user_cols, minlength=len(user_ids)), 1))
+            return mean, _floors(ratings[:, 0], user_cols, len(user_ids))
+
+        return cls._build(resource_ids, links, ratings, len(resource_ids), topic_stats, user_stats)
+
+    @classmethod
+    def load_around(cls, resource_ids):
+        """Только то, что нужно для пересчета списков resource_ids: сами материалы и их кандидаты.
+
+        Кандидат делит с материалом признак, а вектор кандидата зависит лишь
+        от его собственных тем и оценок. Глобальные величины — число
+        материалов, частоты тем, средние оценки, окна хабов — считаются
+        агрегатами в базе, поэтому сходство получается то же, что при полной
+        загрузке, а читается только окрестность изменившихся материалов.
+        """
+        targets = sorted(set(resource_ids))
+        windows = {}
+        candidates = set(targets)
+        for model, field in ((ResourceTopic, 'topic_id'), (Rating, 'user_id')):
+            counts = _aggregate(model, field, set(_values(model, 'resource_id', targets, field)), count=Count('pk'))
+            small = [feature for feature, row in counts.items() if row['count'] <= MAX_POSTINGS]
+            candidates.update(_values(model, field, small, 'resource_id'))
+            for feature in counts.keys() - set(small):
+                windows[model, feature] = floor = (
+                    model.objects.filter(**{field: feature}).order_by('-resource_id')
+                    .values_list('resource_id', flat=True)[MAX_POSTINGS - 1]
+                )
+                candidates.update(model.objects.filter(**{field: feature}, resource_id__gte=floor)
+                                  .values_list('resource_id', flat=True))
+
+        resource_ids = np.array(sorted(_values(Resource, 'pk', candidates, 'pk')), dtype=np.int64)
+        links = _array(_values(ResourceTopic, 'resource_id', resource_ids, 'resource_id', 'topic_id'), 2)
+        ratings = _array(_values(Rating, 'resource_id', resource_ids, 'resource_id', 'user_id', 'rating'), 3)
+
+        def topic_stats(topic_ids, topic_cols):
+            counts = _aggregate(ResourceTopic, 'topic_id', topic_ids, count=Count('pk'))
+            return (np.array([counts[pk]['count'] for pk in topic_ids.tolist()], dtype=np.float64),
+                    np.array([windows.get((ResourceTopic, pk), 0) for pk in topic_ids.tolist()], dtype=np.int64))
+
+        def user_stats(user_ids, user_cols):
+            means = _aggregate(Rating, 'user_id', user_ids, mean=Avg('rating'))
+            return (np.array([means[pk]['mean'] for pk in user_ids.tolist()], dtype=np.float64),
+                    np.array([windows.get((Rating, pk), 0) for pk in user_ids.tolist()], dtype=np.int64))
+
+        return cls._build(resource_ids, links, ratings, Resource.objects.count(), topic_stats, user_stats)
+
+    @classmethod
+    def _build(cls, resource_ids, links, ratings, total, topic_stats, user_stats):
+        # total — число материалов в базе (для IDF), строк может быть меньше
+        n = len(resource_ids)
+        topic_ids, topic_cols = np.unique(links[:, 1], return_inverse=True)
+        topic_rows = np.searchsorted(resource_ids, links[:, 0])
+        frequency, topic_floors = topic_stats(topic_ids, topic_cols)
+        topic_values = (np.log((1 + total) / (1 + frequency)) + 1)[topic_cols]
+
+        user_ids, user_cols = np.unique(ratings[:, 1], return_inverse=True)
+        rating_rows = np.searchsorted(resource_ids, ratings[:, 0])
+        user_mean, user_floors = user_stats(user_ids, user_cols)
+        rating_values = ratings[:, 2] - user_mean[user_cols]
+        # Оценка, равная средней пользователя, о вкусе ничего не говорит
+        keep = rating_values != 0
+        rating_rows, user_cols, rating_values = rating_rows[keep], user_cols[keep], rating_values[keep]
+
+        topic_values = _normalize(topic_rows, topic_values, n) * np.sqrt(TOPIC_WEIGHT)
+        rating_values = _normalize(rating_rows, rating_values, n) * np.sqrt(1 - TOPIC_WEIGHT)
+        return cls(
+            resource_ids,
+            np.concatenate((topic_rows, rating_rows)),
+            np.concatenate((topic_cols, len(topic_ids) + user_cols)),
+            np.concatenate((topic_values, rating_values)),
+            len(topic_ids) + len(user_ids),
+            np.concatenate((topic_floors, user_floors)),
+        )
+
+    def rows_of(self, resource_ids):
+        """Номера строк для id материалов; удаленные материалы пропускаются."""
+        ids = np.asarray(sorted(set(resource_ids)), dtype=np.int64)
+        positions = np.searchsorted(self.resource_ids, ids)
+        found = positions < len(self.resource_ids)
+        found[found] = self.resource_ids[positions[found]] == ids[found]
+        return positions[found]
+
+    def _entries(self, rows):
+        # Индексы ненулевых элементов строк rows
+        rows = np.asarray(rows)
+        return _ranges(self.indptr[rows], self.indptr[rows + 1])
+
+    def similarity(self, rows):
+        """Сходство строк rows с кандидатами: тройки (номер в rows, строка кандидата, сходство).
+
+        Обходит инвертированный индекс: для каждого признака строки берутся
+        строки из окна этого признака, произведения весов суммируются по парам.
+        Работа пропорциональна числу пар с общим признаком, а не размеру базы.
+        """
+        rows = np.asarray(rows)
+        entries = self._entries(rows)
+        owners = np.repeat(np.arange(len(rows)), self.indptr[rows + 1] - self.indptr[rows])
+        columns = self.cols[entries]
+        postings = _ranges(self.column_starts[columns], self.column_ends[columns])
+        lengths = self.column_ends[columns] - self.column_starts[columns]
+        owners = np.repeat(owners, lengths)
+        others = self.column_rows[postings]
+        products = np.repeat(self.values[entries], lengths) * self.column_values[postings]
+        keep = others != rows[owners]  # сам себе не похож
+        pairs, inverse = np.unique(owners[keep] * len(self) + others[keep], return_inverse=True)
+        return pairs // len(self), pairs % len(self), np.bincount(inverse, weights=products[keep])
+
+    def blocks(self, rows):
+        """Делит rows на блоки примерно по PAIR_BUDGET пар и не длиннее MAX_BLOCK строк."""
+        window = (self.column_ends - self.column_starts)[self.cols]
+        cost = np.bincount(self.rows, weights=window, minlength=len(self))[rows]
+        total = np.cumsum(cost)
+        start = 0
+        while start < len(rows):
+            end = int(np.searchsorted(total, total[start] - cost[start] + PAIR_BUDGET, side='right'))
+            end = min(max(end, start + 1), start + MAX_BLOCK)
+            yield rows[start:end]
+            start = end
+
+
+def _normalize(rows, values, n):
+    norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=n))
+    return values / np.where(norms[rows] > 0, norms[rows], 1)
+
+
+def _array(rows, width):
+    return np.array(list(rows), dtype=np.int64).reshape(-1, width)
+
+
+def _chunks(ids):
+    ids = sorted(int(pk) for pk in ids)
+    for start in range(0, len(ids), WRITE_BATCH):
+        yield ids[start:start + WRITE_BATCH]
+
+
+def _values(model, field, ids, *fields):
+    """values_list(*fields) строк, у которых field из ids, — пачками, чтобы не упереться в лимит параметров."""
+    for chunk in _chunks(ids):
+        yield from model.objects.filter(**{f'{field}__in': chunk}).values_list(*fields, flat=len(fields) == 1)
+
+
+def _aggregate(model, field, ids, **aggregates):
+    result = {}
+    for chunk in _chunks(ids):
+        rows = model.objects.filter(**{f'{field}__in': chunk}).values(field).annotate(**aggregates).order_by()
+        result.update((row.pop(field), row) for row in rows)
+    return result
+
+
+def affected(resource_ids):
+    """Материалы, чьи списки могли измениться вместе с resource_ids.
+
+    Скалярное произведение ненулевое только при общем признаке, так что это
+    сами материалы, материалы с общей темой или оценкой того же пользователя
+    и те, в чьих списках изменившийся материал уже стоит. Хабы пропускаются:
+    через них пришлось бы пересчитывать десятки тысяч списков.
+    """
+    changed = sorted(set(resource_ids))
+    result = set(changed)
+    result.update(_values(SimilarResource, 'similar_id', changed, 'resource_id'))
+    for model, field in ((ResourceTopic, 'topic_id'), (Rating, 'user_id')):
+        counts = _aggregate(model, field, set(_values(model, 'resource_id', changed, field)), count=Count('pk'))
+        result.update(_values(model, field, [pk for pk, row in counts.items() if row['count'] <= MAX_POSTINGS],
+                              'resource_id'))
+    return result
+
+
+def top_k(count, owners, columns, scores, k=TOP_K):
+    """Для каждой из count строк — до k пар (столбец, значение) по убыванию, не ниже MIN_SCORE.
+
+    Пары приходят упорядоченными по (owners, columns); сходство косинусное,
+    то есть в [-1, 1], поэтому один устойчивый argsort по owners * 4 - scores
+    группирует по строке, внутри — по убыванию сходства, при равенстве — по столбцу.
+    """
+    strong = scores >= MIN_SCORE
+    owners, columns, scores = owners[strong], columns[strong], scores[strong]
+    order = np.argsort(owners * 4.0 - scores, kind='stable')
+    owners, columns, scores = owners[order], columns[order], scores[order]
+    rank = np.arange(len(owners)) - np.searchsorted(owners, np.arange(count))[owners]
+    keep = rank < k
+    result = [[] for _ in range(count)]
+    for owner, column, score in zip(owners[keep].tolist(), columns[keep].tolist(), scores[keep].tolist()):
+        result[owner].append((column, score))
+    return result
+
+
+def _store(features, rows, neighbours):
+    resource_ids = [int(features.resource_ids[row]) for row in rows]
+    links = [
+        SimilarResource(resource_id=resource_id, similar_id=int(features.resource_ids[column]),
+                        rank=rank, score=score)
+        for resource_id, found in zip(resource_ids, neighbours)
+        for rank, (column, score) in enumerate(found, 1)
+    ]
+    # Короткие транзакции на блок: страница материала всегда видит его список целиком
+    with transaction.atomic():
+        for start in range(0, len(resource_ids), WRITE_BATCH):
+            SimilarResource.objects.filter(resource_id__in=resource_ids[start:start + WRITE_BATCH]).delete()
+        SimilarResource.objects.bulk_create(links, batch_size=WRITE_BATCH)
+
+
+def refresh(resource_ids=None):
+    """Пересчитывает списки похожих материалов и возвращает число обновленных.
+
+    resource_ids=None — все материалы. Иначе — материалы из affected():
+    признаки читаются только для них и их кандидатов (Features.load_around).
+    Вторичные сдвиги — вес IDF темы, средняя оценка пользователя, новые
+    соседи через признаки-хабы — догоняет полный пересчет по расписанию
+    (manage.py build_similar_resources): задеть пришлось бы почти всю базу.
+    """
+    if np is None:
+        raise RuntimeError('Для подбора похожих материалов нужен NumPy (pip install numpy)')
+    targets = None if resource_ids is None else affected(resource_ids)
+    if targets is not None and len(targets) > FULL_REBUILD_SHARE * Resource.objects.count():
+        targets = None
+    if targets is None:
+        features = Features.load()
+        rows = np.arange(len(features))
+    else:
+        features = Features.load_around(targets)
+        rows = features.rows_of(targets)
+
+    for block in features.blocks(rows):
+        _store(features, block, top_k(len(block), *features.similarity(block)))
+    logger.info('Похожие материалы пересчитаны для %s материалов (загружено строк: %s)', len(rows), len(features))
+    return len(rows)
+
+
+def schedule(resource_ids):
+    """Ставит пересчет для изменившихся материалов, объединяя его с уже ждущей задачей.
+
+    Оценки и темы меняются пачками, а каждый пересчет читает все связи заново,
+    поэтому id дописываются в задачу, которая еще в очереди. UPDATE условный:
+    он срабатывает, только если задача все еще в очереди и ее kwargs не
+    изменились с момента чтения. Иначе параллельный запрос успел дописать
+    свои id или обработчик взял задачу — читаем заново, а после MERGE_ATTEMPTS
+    неудач ставим отдельную задачу: лишний пересчет лучше потерянных id.
+    """
+    if np is None:
+        return
+    resource_ids = {int(pk) for pk in resource_ids}
+    if not resource_ids:
+        return
+    for _ in range(MERGE_ATTEMPTS):
+        pending = Job.objects.filter(name=TASK, status=Job.STATUS_QUEUED).order_by('pk').first()
+        if pending is None:
+            break
+        queued = pending.kwargs.get('resource_ids')
+        if queued is None:
+            return  # уже ждет полный пересчет
+        merged = resource_ids | set(queued)
+        kwargs = {'resource_ids': sorted(merged)} if len(merged) <= MAX_PENDING_IDS else {}
+        if Job.objects.filter(pk=pending.pk, status=Job.STATUS_QUEUED, kwargs=pending.kwargs).update(kwargs=kwargs):
+            return
+    jobs.enqueue(TASK, kwargs={'resource_ids': sorted(resource_ids)}, delay=timedelta(seconds=REFRESH_DELAY))
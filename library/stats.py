@@ -0,0 +1,51 @@
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .models import Resource
+
+TOPIC_STATS_TIMEOUT = 60 * 60
+
+
+def _topic_stats_key(topic_id):
+    return f'library:topic_stats:{topic_id}'
+
+
+class TopicStats:
+    def __init__(self, total=0, authors=0, by_type=None):
+        self.total = total
+        self.authors = authors
+        self.by_type = by_type or {}
+
+    def count_by_type(self, resource_type):
+        return self.by_type.get(resource_type, 0)
+
+
+def compute_topic_stats(topic_id):
+    # Одна агрегация: общее число, число по каждому типу и уникальные авторы
+    aggregates = {
+        resource_type: Count('id', filter=Q(resource_type=resource_type))
+        for resource_type, _ in Resource.TYPE_CHOICES
+    }
+    row = Resource.objects.filter(topics=topic_id).order_by().aggregate(
+        _total=Count('id'),
+        _authors=Count('author', distinct=True),
+        **aggregates
+    )
+    return TopicStats(
+        total=row.pop('_total'),
+        authors=row.pop('_authors'),
+        by_type=row,
+    )
+
+
+def get_topic_stats(topic_id):
+    key = _topic_stats_key(topic_id)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_topic_stats(topic_id)
+        cache.set(key, stats, TOPIC_STATS_TIMEOUT)
+    return stats
+
+
+def invalidate_topic_stats(topic_ids):
+    cache.delete_many([_topic_stats_key(topic_id) for topic_id in topic_ids])
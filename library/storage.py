@@ -0,0 +1,93 @@
+import hashlib
+import os
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Сколько секунд файл после последнего использования не удаляется: загрузка,
+# попавшая на уже существующий файл, успевает закоммитить ссылку на него
+RELEASE_GRACE_PERIOD = 10 * 60
+
+
+def content_hash(content):
+    """sha256 файла, прочитанного потоком по chunks(): большой файл целиком в память не попадает."""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    # resources/ab/cd/abcd…ef.pdf — два уровня по 256 каталогов, чтобы не держать
+    # десятки тысяч файлов в одной папке; расширение нужно для Content-Type при отдаче
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()[:10]
+    return os.path.join(directory, digest[:2], digest[2:4], f'{digest}{extension}')
+
+
+def is_hashed_name(name):
+    parts = name.replace('\\', '/').split('/')
+    digest = os.path.splitext(parts[-1])[0]
+    return (
+        len(parts) >= 3 and len(digest) == 64 and all(ch in '0123456789abcdef' for ch in digest)
+        and parts[-3] == digest[:2] and parts[-2] == digest[2:4]
+    )
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит файлы под именем от sha256 содержимого.
+
+    Одинаковые загрузки получают одно и то же имя: если файл уже есть,
+    он не перезаписывается, а запись в модели просто ссылается на него.
+    Удалять такой файл можно только когда на него не осталось ссылок —
+    см. Resource.release_file(). Проверка ссылок не видит еще не
+    закоммиченную запись параллельной загрузки, поэтому каждое повторное
+    использование обновляет mtime файла, а delete_unused() не трогает файлы,
+    использованные за последние RELEASE_GRACE_PERIOD секунд.
+    """
+
+    def _save(self, name, content):
+        name = hashed_name(name, content_hash(content))
+        if self.touch(name):
+            return name
+        # При гонке двух одинаковых загрузок FileSystemStorage сохранит вторую
+        # под соседним именем — лишняя копия, но не ошибка
+        return super()._save(name, content)
+
+    def touch(self, name):
+        """Отмечает файл как только что использованный; False — файла нет."""
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _recently_used(self, path):
+        return time.time() - os.stat(path).st_mtime < RELEASE_GRACE_PERIOD
+
+    def delete_unused(self, name):
+        """Удаляет файл, если его не использовали RELEASE_GRACE_PERIOD секунд.
+
+        False — файл недавно понадобился снова, проверить ссылки нужно позже.
+        Файл сначала атомарно переименовывается: загрузка, которая после этого
+        его не найдет, запишет копию заново, а если она успела обновить mtime
+        до переименования, файл возвращается на место.
+        """
+        path = self.path(name)
+        tombstone = f'{path}.deleting'
+        try:
+            if self._recently_used(path):
+                return False
+            os.replace(path, tombstone)
+        except FileNotFoundError:
+            return True
+        if self._recently_used(tombstone):
+            os.replace(tombstone, path)
+            return False
+        os.remove(tombstone)
+        return True
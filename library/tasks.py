@@ -0,0 +1,45 @@
+import logging
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+
+from . import similar, thumbnails
+from .cache_versions import bump
+from .jobs import PRIORITY_HIGH, PRIORITY_LOW, enqueue, task
+from .models import Resource
+from .storage import RELEASE_GRACE_PERIOD
+
+logger = logging.getLogger(__name__)
+
+
+@task('library.release_file', priority=PRIORITY_LOW)
+def release_file(name):
+    if not Resource.release_file(name):
+        enqueue('library.release_file', args=[name], delay=timedelta(seconds=RELEASE_GRACE_PERIOD))
+
+
+@task('library.delete_media', priority=PRIORITY_LOW)
+def delete_media(name):
+    # Файл вне хранилища по хешу (например, фото профиля) — ссылок на него больше нет
+    default_storage.delete(name)
+    thumbnails.delete(name)
+
+
+@task('library.generate_thumbnails', priority=PRIORITY_HIGH, max_attempts=2)
+def generate_thumbnails(name, dependencies=()):
+    # Все медиафайлы лежат в MEDIA_ROOT, поэтому читать можно через default_storage
+    if not default_storage.exists(name) or thumbnails.is_ready(name):
+        return
+    try:
+        thumbnails.generate(default_storage, name)
+    except thumbnails.GENERATION_ERRORS:
+        logger.exception('Не удалось создать превью для %s', name)
+        thumbnails.mark_failed(name)
+        return
+    if dependencies:
+        bump(*dependencies)
+
+
+@task(similar.TASK, priority=PRIORITY_LOW, max_attempts=3)
+def refresh_similar(resource_ids=None):
+    similar.refresh(resource_ids)
@@ -0,0 +1,58 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Model
+
+from library.cache_versions import get_versions
+
+register = template.Library()
+
+FRAGMENT_PREFIX = 'library:fragment'
+
+
+class CacheFragmentNode(template.Node):
+    def __init__(self, nodelist, name, dependencies):
+        self.nodelist = nodelist
+        self.name = name
+        self.dependencies = dependencies
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        values = [dependency.resolve(context) for dependency in self.dependencies]
+
+        # Модели и строки-группы — версионируемые зависимости, остальное (флаги и т.п.) просто входит в ключ
+        tracked = [value for value in values if isinstance(value, (Model, str))]
+        vary_on = [value for value in values if not isinstance(value, (Model, str))]
+        versions = get_versions(tracked)
+
+        parts = [f'{getattr(value, "pk", value)}@{version}' for value, version in zip(tracked, versions)]
+        parts += [str(value) for value in vary_on]
+        digest = hashlib.md5(':'.join(parts).encode(), usedforsecurity=False).hexdigest()
+        key = f'{FRAGMENT_PREFIX}:{name}:{digest}'
+
+        content = cache.get(key)
+        if content is None:
+            content = self.nodelist.render(context)
+            cache.set(key, content, getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 60 * 60))
+        return content
+
+
+@register.tag
+def cachefragment(parser, token):
+    """{% cachefragment "имя" resource "topics" user.is_authenticated %} ... {% endcachefragment %}
+
+    Ключ фрагмента строится из версий зависимостей, которые повышаются
+    сигналами в library.signals при изменении данных.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' требует как минимум имя фрагмента")
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    return CacheFragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
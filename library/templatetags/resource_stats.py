@@ -3,9 +3,9 @@ from django import template
 register = template.Library()
 
 @register.filter
-def count_by_type(resources, resource_type):
-    return resources.filter(resource_type=resource_type).count()
+def count_by_type(stats, resource_type):
+    return stats.count_by_type(resource_type)
 
 @register.filter
-def count_authors(resources):
-    return resources.values('author').distinct().count()
\ No newline at end of file
+def count_authors(stats):
+    return stats.authors
@@ -0,0 +1,47 @@
+from django import template
+from django.urls import reverse
+
+from .. import jobs, thumbnails
+from ..cache_versions import model_key
+
+register = template.Library()
+
+
+def _url(name, size, fmt):
+    return reverse('thumbnail', args=[thumbnails.thumbnail_name(name, size, fmt)])
+
+
+@register.inclusion_tag('library/picture.html', takes_context=True)
+def picture(context, file, width, alt='', css_class=''):
+    """Превью файла шириной width: WebP с JPEG для старых браузеров, 1x и 2x.
+
+    Если превью еще нет, генерация ставится в очередь задач (один раз на файл),
+    а тег ничего не выводит; по готовности версия владельца файла сбрасывается,
+    и кешированные фрагменты с ним перерисуются уже с картинкой.
+        {% picture resource.file 320 alt=resource.title css_class="card-img-top" %}
+
+    Превью, как и сами файлы, отдаются только вошедшим пользователям — гостям
+    тег ничего не выводит (во фрагментах кеша учитывайте user.is_authenticated).
+    """
+    name = getattr(file, 'name', None)
+    user = context.get('user')
+    if not name or not thumbnails.can_preview(name) or user is None or not user.is_authenticated:
+        return {'ready': False}
+    if not thumbnails.is_ready(name):
+        if not thumbnails.is_failed(name) and thumbnails.claim(name):
+            instance = getattr(file, 'instance', None)
+            dependencies = [model_key(instance, instance.pk)] if instance is not None else []
+            jobs.enqueue('library.generate_thumbnails', args=[name, dependencies])
+        return {'ready': False}
+
+    size, retina = thumbnails.pick_size(width), thumbnails.pick_size(width * 2)
+    return {
+        'ready': True,
+        'width': width,
+        'alt': alt,
+        'css_class': css_class,
+        'webp': _url(name, size, 'webp'),
+        'webp_2x': _url(name, retina, 'webp'),
+        'jpeg': _url(name, size, 'jpeg'),
+        'jpeg_2x': _url(name, retina, 'jpeg'),
+    }
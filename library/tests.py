@@ -0,0 +1,337 @@
+import os
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import search, similar, thumbnails
+from .forms import SearchForm
+from .importer import ResourceImporter
+from .models import Bookmark, Job, Rating, Resource, Topic
+from .pagination import KeysetPaginator
+from .storage import RELEASE_GRACE_PERIOD, ContentAddressedStorage
+from .templatetags.thumbnails import picture
+from .views import RESOURCES_PER_PAGE, filter_resources, similar_links
+
+
+class ThumbnailViewTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_SENDFILE=None)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.original = 'resources/ab/cd/secret.pdf'
+        self.preview = thumbnails.thumbnail_name(self.original, 'sm', 'jpeg')
+        for name, content in ((self.original, b'%PDF secret'), (self.preview, b'jpeg')):
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as fh:
+                fh.write(content)
+        self.user = get_user_model().objects.create_user('reader', password='password')
+
+    def test_serves_thumbnail_to_logged_in_user(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('thumbnail', args=[self.preview]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'jpeg')
+
+    def test_anonymous_user_is_redirected_to_login(self):
+        response = self.client.get(reverse('thumbnail', args=[self.preview]))
+        self.assertEqual(response.status_code, 302)
+
+    def test_path_traversal_is_rejected(self):
+        self.client.force_login(self.user)
+        for path in (
+            '/media/thumbs/../resources/ab/cd/secret.pdf',
+            '/media/thumbs/%2e%2e/resources/ab/cd/secret.pdf',
+            '/media/thumbs/..%2fresources/ab/cd/secret.pdf',
+            '/media/thumbs/%2E%2E%2Fresources%2Fab%2Fcd%2Fsecret.pdf',
+            '/media/resources/ab/cd/secret.pdf',
+            f'/media/{self.preview}/../../../../resources/ab/cd/secret.pdf',
+        ):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path).status_code, 404)
+
+    def test_is_thumbnail_name(self):
+        self.assertTrue(thumbnails.is_thumbnail_name(self.preview))
+        self.assertFalse(thumbnails.is_thumbnail_name('thumbs/../resources/ab/cd/secret.pdf'))
+        self.assertFalse(thumbnails.is_thumbnail_name(self.preview.replace('.jpeg', '.pdf')))
+        self.assertFalse(thumbnails.is_thumbnail_name('thumbs/00/' + self.preview.split('/', 2)[2]))
+
+
+@override_settings(JOB_QUEUE_EAGER=False)
+class PictureTagTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('reader', password='password')
+        self.file = SimpleNamespace(name='resources/ab/cd/photo.png', instance=self.user)
+        self.addCleanup(cache.clear)
+
+    def test_missing_thumbnail_is_queued_once(self):
+        for _ in range(3):
+            self.assertEqual(picture({'user': self.user}, self.file, 320), {'ready': False})
+        job = Job.objects.get(name='library.generate_thumbnails')
+        self.assertEqual(job.args, [self.file.name, [f'accounts.customuser:{self.user.pk}']])
+
+    def test_failed_thumbnail_is_not_queued(self):
+        thumbnails.mark_failed(self.file.name)
+        picture({'user': self.user}, self.file, 320)
+        self.assertFalse(Job.objects.exists())
+
+
+@override_settings(JOB_QUEUE_EAGER=False)
+class SimilarScheduleTests(TestCase):
+    def setUp(self):
+        if not similar.available():
+            self.skipTest('NumPy не установлен')
+
+    def pending_ids(self):
+        return [job.kwargs.get('resource_ids') for job in Job.objects.filter(name=similar.TASK).order_by('pk')]
+
+    def test_ids_are_merged_into_queued_job(self):
+        similar.schedule([1, 2])
+        similar.schedule([2, 3])
+        self.assertEqual(self.pending_ids(), [[1, 2, 3]])
+
+    def test_concurrent_merge_is_not_lost(self):
+        similar.schedule([1])
+        stale = Job.objects.get(name=similar.TASK)
+        # Параллельный запрос дописал свои id между нашим чтением и UPDATE
+        Job.objects.filter(pk=stale.pk).update(kwargs={'resource_ids': [1, 2]})
+        original_first = QuerySet.first
+        reads = iter([stale])
+
+        def first(queryset):
+            return next(reads, None) or original_first(queryset)
+
+        with mock.patch.object(QuerySet, 'first', first):
+            similar.schedule([3])
+        self.assertEqual(self.pending_ids(), [[1, 2, 3]])
+
+
+class SimilarFeaturesTests(SimpleTestCase):
+    def setUp(self):
+        if not similar.available():
+            self.skipTest('NumPy не установлен')
+
+    def features(self, dense, floors=None):
+        np = similar.np
+        rows, cols = np.nonzero(dense)
+        return similar.Features(
+            np.arange(1, dense.shape[0] + 1, dtype=np.int64), rows, cols, dense[rows, cols], dense.shape[1],
+            np.zeros(dense.shape[1], dtype=np.int64) if floors is None else floors,
+        )
+
+    def test_similarity_matches_dense_product(self):
+        np = similar.np
+        dense = np.random.default_rng(1).random((40, 12)) * (np.random.default_rng(2).random((40, 12)) < 0.2)
+        features = self.features(dense)
+        expected = dense @ dense.T
+        np.fill_diagonal(expected, 0)
+        owners, columns, scores = features.similarity(np.arange(40))
+        found = np.zeros_like(expected)
+        found[owners, columns] = scores
+        np.testing.assert_allclose(found, expected, rtol=1e-5, atol=1e-6)
+
+    def test_hub_feature_offers_only_newest_candidates(self):
+        np = similar.np
+        dense = np.ones((10, 1))
+        features = self.features(dense, floors=np.array([8]))
+        neighbours = similar.top_k(1, *features.similarity([0]))[0]
+        self.assertEqual([column for column, _ in neighbours], [7, 8, 9])
+
+
+@override_settings(JOB_QUEUE_EAGER=False)
+class SimilarLoadAroundTests(TestCase):
+    def setUp(self):
+        if not similar.available():
+            self.skipTest('NumPy не установлен')
+        User = get_user_model()
+        users = [User.objects.create_user(f'rater{index}', password='password') for index in range(4)]
+        topics = [Topic.objects.create(name=f'Тема {index}') for index in range(3)]
+        self.resources = []
+        for index in range(12):
+            resource = Resource.objects.create(
+                title=f'Материал {index}', description='Описание', resource_type='pdf', author=users[0],
+            )
+            resource.topics.set([topics[0], topics[1 + index % 2]])
+            for offset, user in enumerate(users[:1 + index % 4]):
+                Rating.objects.create(resource=resource, user=user, rating=1 + (index + offset) % 5)
+            self.resources.append(resource)
+
+    def lists(self, features, resource_ids):
+        rows = features.rows_of(resource_ids)
+        found = similar.top_k(len(rows), *features.similarity(rows))
+        return {
+            int(features.resource_ids[row]): [(int(features.resource_ids[column]), round(score, 5))
+                                              for column, score in neighbours]
+            for row, neighbours in zip(rows, found)
+        }
+
+    def test_matches_full_load(self):
+        # Тема 0 есть у всех материалов — при MAX_POSTINGS = 4 она хаб
+        with mock.patch.object(similar, 'MAX_POSTINGS', 4):
+            targets = similar.affected([self.resources[0].pk])
+            partial = similar.Features.load_around(targets)
+            full = similar.Features.load()
+            self.assertLess(len(partial), len(full))
+            self.assertEqual(self.lists(partial, targets), self.lists(full, targets))
+
+
+@override_settings(JOB_QUEUE_EAGER=False)
+class ResourceImporterTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('importer', password='password')
+
+    def row(self, **values):
+        return {'title': 'Материал', 'description': 'Описание', 'resource_type': 'pdf', **values}
+
+    def test_too_long_external_id_is_a_line_error(self):
+        report = ResourceImporter(self.user).run(enumerate([self.row(external_id='x' * 101), self.row()], 1))
+        self.assertEqual(report.created, 1)
+        self.assertEqual([error['line'] for error in report.errors], [1])
+
+    def test_only_inserted_topics_are_counted(self):
+        Topic.objects.create(name='Существующая')
+        rows = [self.row(topics='Существующая; Новая'), self.row(topics='Новая; Еще одна')]
+        self.assertEqual(ResourceImporter(self.user).run(enumerate(rows, 1)).topics_created, 2)
+        self.assertEqual(ResourceImporter(self.user).run(enumerate(rows, 1)).topics_created, 0)
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def age(self, name, seconds):
+        path = self.storage.path(name)
+        stamp = os.stat(path).st_mtime - seconds
+        os.utime(path, (stamp, stamp))
+
+    def test_recently_reused_file_is_kept(self):
+        name = self.storage.save('resources/a.pdf', ContentFile(b'same'))
+        self.age(name, RELEASE_GRACE_PERIOD * 2)
+        # Повторная загрузка того же содержимого, ее запись еще не закоммичена
+        self.assertEqual(self.storage.save('resources/b.pdf', ContentFile(b'same')), name)
+        self.assertFalse(self.storage.delete_unused(name))
+        self.assertTrue(self.storage.exists(name))
+
+    def test_unused_file_is_deleted_after_grace_period(self):
+        name = self.storage.save('resources/a.pdf', ContentFile(b'data'))
+        self.age(name, RELEASE_GRACE_PERIOD + 1)
+        self.assertTrue(self.storage.delete_unused(name))
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(os.path.exists(self.storage.path(name) + '.deleting'))
+
+    def test_missing_file_counts_as_released(self):
+        self.assertTrue(self.storage.delete_unused('resources/00/00/missing.pdf'))
+
+
+@override_settings(JOB_QUEUE_EAGER=False)
+class QueryPlanTests(TestCase):
+    """Горячие запросы не должны читать таблицы материалов, оценок и закладок целиком.
+
+    «SCAN таблица» без USING INDEX в EXPLAIN QUERY PLAN — полный просмотр;
+    SCAN по индексу — обход в нужном порядке, он допустим.
+    """
+    FULL_SCAN_RE = re.compile(r'\bSCAN (?:TABLE )?(\w+)(?! USING)(?:\s|$)')
+    WATCHED_TABLES = {Resource._meta.db_table, Rating._meta.db_table, Bookmark._meta.db_table}
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user('planner', password='password')
+        cls.topic = Topic.objects.create(name='Алгебра')
+        for index in range(RESOURCES_PER_PAGE * 3):
+            resource = Resource.objects.create(
+                title=f'Линейная алгебра, часть {index}', description='Матрицы и определители',
+                resource_type='pdf' if index % 2 else 'video', author=cls.user,
+            )
+            resource.topics.add(cls.topic)
+            Rating.objects.create(resource=resource, user=cls.user, rating=1 + index % 5)
+            Bookmark.objects.create(resource=resource, user=cls.user)
+        cls.resource = resource
+
+    def assertNoFullScan(self, name, queryset):
+        plan = queryset.explain()
+        scans = set(self.FULL_SCAN_RE.findall(plan)) & self.WATCHED_TABLES
+        self.assertFalse(scans, f'{name}: полный просмотр {", ".join(sorted(scans))}\n{plan}')
+
+    def pages(self, queryset, ordering=('-created_at', '-pk')):
+        """Запросы первой и второй страницы: со второй в WHERE появляется условие по курсору."""
+        paginator = KeysetPaginator(queryset, RESOURCES_PER_PAGE, ordering=ordering)
+        first = paginator.get_page()
+        self.assertTrue(first.has_next)
+        return [paginator._page_query(None)[0], paginator._page_query(first.next_cursor)[0]]
+
+    def test_hot_queries_use_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Разбор EXPLAIN QUERY PLAN написан для SQLite')
+        today = timezone.localdate()
+        lists = {
+            'список': {},
+            'список: тип': {'resource_type': 'pdf'},
+            'список: даты': {'date_from': today.replace(year=today.year - 1), 'date_to': today},
+            'список: тип и даты': {'resource_type': 'video', 'date_from': today.replace(day=1)},
+            'список: тема': {'topic': self.topic.pk},
+            'список: популярные': {'sort': 'popular'},
+        }
+        if search.is_available():
+            lists['поиск'] = {'query': 'алгебра'}
+            lists['поиск: тип'] = {'query': 'алгебра', 'resource_type': 'pdf'}
+        for name, data in lists.items():
+            form = SearchForm(data)
+            self.assertTrue(form.is_valid(), form.errors)
+            resources, ordering = filter_resources(form)
+            for number, queryset in enumerate(self.pages(resources, ordering), 1):
+                with self.subTest(query=name, page=number):
+                    self.assertNoFullScan(f'{name}, страница {number}', queryset)
+
+        topic_resources = Resource.objects.for_cards().filter(topics=self.topic)
+        for number, queryset in enumerate(self.pages(topic_resources), 1):
+            with self.subTest(query='тема', page=number):
+                self.assertNoFullScan(f'тема, страница {number}', queryset)
+
+        for name, queryset in (
+            ('профиль: материалы', Resource.objects.for_cards().filter(author=self.user)),
+            ('профиль: избранное', Bookmark.objects.filter(user=self.user).select_related('resource')),
+            ('профиль: оценки', Rating.objects.filter(user=self.user).select_related('resource')),
+            ('материал: отзывы', Rating.objects.filter(resource=self.resource).select_related('user')),
+            ('материал: похожие', similar_links(self.resource)),
+        ):
+            with self.subTest(query=name):
+                self.assertNoFullScan(name, queryset)
+
+
+@override_settings(JOB_QUEUE_EAGER=False, JOB_LOCK_TIMEOUT=60)
+class RunJobsOnceTests(TestCase):
+    def test_once_reclaims_jobs_of_crashed_workers(self):
+        locked_at = timezone.now() - timedelta(seconds=120)
+        stale = Job.objects.create(
+            name='library.release_file', args=[''], run_at=locked_at, status=Job.STATUS_RUNNING,
+            attempts=1, locked_by='dead:1:0', locked_at=locked_at,
+        )
+        fresh = Job.objects.create(
+            name='library.release_file', args=[''], run_at=locked_at, status=Job.STATUS_RUNNING,
+            attempts=1, locked_by='alive:1:0', locked_at=timezone.now(),
+        )
+        call_command('run_jobs', '--once', stdout=StringIO())
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(stale.status, Job.STATUS_DONE)
+        self.assertEqual(fresh.status, Job.STATUS_RUNNING)
@@ -0,0 +1,155 @@
+import hashlib
+import logging
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+try:
+    import fitz  # PyMuPDF, необязательная зависимость для превью PDF
+except ImportError:
+    fitz = None
+
+logger = logging.getLogger(__name__)
+
+# Наибольшая сторона варианта в пикселях
+SIZES = {'xs': 64, 'sm': 160, 'md': 320, 'lg': 800}
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+QUALITY = {'webp': 80, 'jpeg': 82}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tiff'}
+THUMBNAIL_DIR = 'thumbs'
+READY_PREFIX = 'library:thumbs'
+# Ровно то, что строит thumbnail_name(): thumbs/<md5[:2]>/<md5>/<размер>.<формат>
+THUMBNAIL_RE = re.compile(
+    rf'^{THUMBNAIL_DIR}/(?P<prefix>[0-9a-f]{{2}})/(?P<key>[0-9a-f]{{32}})/'
+    rf'(?:{"|".join(SIZES)})\.(?:{"|".join(FORMATS)})$'
+)
+FAILED_RETRY_AFTER = 3600
+# Сколько секунд файл считается уже поставленным в очередь: за это время задача
+# успевает выполниться, а если обработчик ее потерял — поставим снова
+QUEUED_TIMEOUT = 15 * 60
+# Ошибки чтения исходника: битый или неподдерживаемый файл, повтор не поможет
+GENERATION_ERRORS = (OSError, UnidentifiedImageError, Image.DecompressionBombError, RuntimeError)
+
+
+def source_key(name):
+    return hashlib.md5(name.encode('utf-8')).hexdigest()
+
+
+def thumbnail_name(name, size, fmt):
+    key = source_key(name)
+    return f'{THUMBNAIL_DIR}/{key[:2]}/{key}/{size}.{fmt}'
+
+
+def is_thumbnail_name(name):
+    """Проверяет, что name — имя превью, а не произвольный путь в MEDIA_ROOT."""
+    if '..' in name or posixpath.normpath(name) != name:
+        return False
+    match = THUMBNAIL_RE.match(name)
+    return match is not None and match['key'].startswith(match['prefix'])
+
+
+def pick_size(width):
+    """Наименьший вариант не уже width; для больших значений — самый крупный."""
+    for size, pixels in sorted(SIZES.items(), key=lambda item: item[1]):
+        if pixels >= width:
+            return size
+    return max(SIZES, key=SIZES.get)
+
+
+def can_preview(name):
+    extension = os.path.splitext(name or '')[1].lower()
+    return extension in IMAGE_EXTENSIONS or (extension == '.pdf' and fitz is not None)
+
+
+def is_ready(name):
+    if not name:
+        return False
+    key = f'{READY_PREFIX}:{source_key(name)}'
+    if cache.get(key):
+        return True
+    # Кеш мог быть очищен — проверяем по последнему записываемому варианту
+    if default_storage.exists(thumbnail_name(name, max(SIZES, key=SIZES.get), 'jpeg')):
+        cache.set(key, True, None)
+        return True
+    return False
+
+
+def _open_source(storage, name):
+    with storage.open(name) as fh:
+        if name.lower().endswith('.pdf'):
+            document = fitz.open(stream=fh.read(), filetype='pdf')
+            try:
+                page = document.load_page(0)
+                zoom = SIZES['lg'] / max(page.rect.width, page.rect.height)
+                pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+                return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+            finally:
+                document.close()
+        image = Image.open(fh)
+        image.load()
+    # Поворот по EXIF, иначе фото с телефона окажутся на боку
+    return ImageOps.exif_transpose(image)
+
+
+def _write(image, name, fmt):
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Пишем во временный файл и переименовываем: читатель не увидит недописанную картинку
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            image.save(fh, FORMATS[fmt], quality=QUALITY[fmt], optimize=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def generate(storage, name):
+    """Создает все варианты SIZES × FORMATS для файла name из storage."""
+    image = _open_source(storage, name)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image.mode in ('LA', 'P', 'PA') else 'RGB')
+    # От большего к меньшему: каждый следующий вариант уменьшается из предыдущего, а не из оригинала
+    for size, pixels in sorted(SIZES.items(), key=lambda item: -item[1]):
+        image.thumbnail((pixels, pixels), Image.LANCZOS)
+        for fmt in ('webp', 'jpeg'):
+            variant = image.convert('RGB') if fmt == 'jpeg' and image.mode != 'RGB' else image
+            _write(variant, thumbnail_name(name, size, fmt), fmt)
+    cache.set(f'{READY_PREFIX}:{source_key(name)}', True, None)
+
+
+def delete(name):
+    if not name:
+        return
+    for size in SIZES:
+        for fmt in FORMATS:
+            default_storage.delete(thumbnail_name(name, size, fmt))
+    cache.delete(f'{READY_PREFIX}:{source_key(name)}')
+
+
+def is_failed(name):
+    return bool(cache.get(f'{READY_PREFIX}:failed:{source_key(name)}'))
+
+
+def mark_failed(name):
+    # Битый файл не должен ставиться в очередь при каждом показе страницы
+    cache.set(f'{READY_PREFIX}:failed:{source_key(name)}', True, FAILED_RETRY_AFTER)
+
+
+def needs_generation(name):
+    return can_preview(name) and not is_ready(name) and not is_failed(name)
+
+
+def claim(name):
+    """Отмечает, что превью для name ставится в очередь; False — его уже поставили.
+
+    cache.add атомарен, поэтому при общем кеше задачу на файл ставит один
+    запрос, сколько бы страниц с ним ни открылось одновременно.
+    """
+    return cache.add(f'{READY_PREFIX}:queued:{source_key(name)}', True, QUEUED_TIMEOUT)
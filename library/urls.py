@@ -1,18 +1,27 @@
+from django.conf import settings
 from django.urls import path
 from django.views.generic import RedirectView
 
-from . import views
+from . import async_views, views
+
+read_views = async_views if settings.ASYNC_READ_VIEWS else views
 
 urlpatterns = [
-    path('', views.home, name='home'),
-    path('resources/', views.resource_list, name='resource_list'),
+    path('', read_views.home, name='home'),
+    path('resources/', read_views.resource_list, name='resource_list'),
     path('resources/add/', views.add_resource, name='add_resource'),
-    path('resources/<int:pk>/', views.resource_detail, name='resource_detail'),
+    path('resources/export/', views.export_resources, name='export_resources'),
+    path('resources/import/', views.import_resources, name='import_resources'),
+    path('resources/<int:pk>/', read_views.resource_detail, name='resource_detail'),
+    path('resources/<int:pk>/file/', views.resource_file, name='resource_file'),
+    path('media/<path:name>', views.thumbnail, name='thumbnail'),
     path('resources/<int:pk>/edit/', views.edit_resource, name='edit_resource'),
     path('resources/<int:pk>/delete/', views.delete_resource, name='delete_resource'),
     path('resources/<int:pk>/delete-ajax/', views.delete_resource_ajax, name='delete_resource_ajax'),
     path('resources/<int:pk>/bookmark/', views.bookmark_toggle, name='bookmark_toggle'),
-    path('topics/<int:pk>/', views.topic_detail, name='topic_detail'),
+    path('resources/<int:pk>/bookmark-ajax/', views.bookmark_toggle_ajax, name='bookmark_toggle_ajax'),
+    path('resources/<int:pk>/rate-ajax/', views.rate_resource_ajax, name='rate_resource_ajax'),
+    path('topics/<int:pk>/', read_views.topic_detail, name='topic_detail'),
     path('topics/manage/', views.manage_topics, name='manage_topics'),
     path('topics/manage/', RedirectView.as_view(pattern_name='topic_list', permanent=True)),
     path('review/<int:pk>/edit/', views.edit_review, name='edit_review'),
@@ -1,30 +1,38 @@
 import json
+import os
+from datetime import datetime, time, timedelta
 
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.files.storage import default_storage
+from django.db import transaction
 from django.db.models import Avg, Count, Q
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.http import HttpResponseForbidden, JsonResponse
+from django.http import Http404, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import slugify
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth import get_user_model, login
 
-from .models import Resource, Topic, Rating, Bookmark
+from accounts.ratelimit import ratelimit
+
+from . import export, importer, media, search, thumbnails
+from .pagination import KeysetPaginator
+from .stats import get_topic_stats
+from .models import Resource, Topic, Rating, Bookmark, SimilarResource
 from .forms import ResourceForm, SearchForm, RatingForm, TopicForm
 
 User = settings.AUTH_USER_MODEL
 
 def home(request):
-    latest_resources = Resource.objects.all()[:10]
-    popular_resources = Resource.objects.annotate(
-        avg_rating=Avg('ratings__rating'),
-        rating_count=Count('ratings')
-    ).order_by('-avg_rating', '-rating_count')[:10]
+    latest_resources = Resource.objects.for_cards()[:10]
+    popular_resources = Resource.objects.popular().select_related('popularity').order_by(*POPULAR_ORDERING)[:10]
 
-    topics = Topic.objects.all()[:8]
+    topics = Topic.objects.annotate(resource_count=Count('resource'))[:8]
 
     context = {
         'latest_resources': latest_resources,
@@ -33,9 +41,27 @@ def home(request):
     }
     return render(request, 'library/home.html', context)
 
-def resource_list(request):
-    form = SearchForm(request.GET or None)
-    resources = Resource.objects.all()
+RESOURCES_PER_PAGE = 12
+SIMILAR_RESOURCES_SHOWN = 5
+# Байесовский рейтинг из таблицы ResourcePopularity, см. ResourceQuerySet.popular()
+POPULAR_ORDERING = ('-popularity_score', '-popularity_id')
+
+
+def _querystring_without_cursor(request):
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    return params.urlencode()
+
+
+def start_of_day(day):
+    # Полночь в часовом поясе сайта — так же считал created_at__date при USE_TZ
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def filter_resources(form):
+    # Общая часть синхронного и асинхронного списка: валидация формы и поиск обращаются к БД
+    resources = Resource.objects.for_cards()
+    ordering = ('-created_at', '-pk')
 
     if form.is_valid():
         query = form.cleaned_data.get('query')
@@ -43,12 +69,11 @@ def resource_list(request):
         topic = form.cleaned_data.get('topic')
         date_from = form.cleaned_data.get('date_from')
         date_to = form.cleaned_data.get('date_to')
+        sort = form.cleaned_data.get('sort')
 
         if query:
-            resources = resources.filter(
-                Q(title__icontains=query) |
-                Q(description__icontains=query)
-            )
+            resources = search.search_resources(resources, query)
+            ordering = search.ORDERING
 
         if resource_type:
             resources = resources.filter(resource_type=resource_type)
@@ -56,26 +81,54 @@ def resource_list(request):
         if topic:
             resources = resources.filter(topics=topic)
 
+        # Полуоткрытый диапазон [начало date_from, начало дня после date_to) по самому
+        # столбцу: created_at__date оборачивает его в функцию, и индекс не используется
         if date_from:
-            resources = resources.filter(created_at__date__gte=date_from)
+            resources = resources.filter(created_at__gte=start_of_day(date_from))
 
         if date_to:
-            resources = resources.filter(created_at__date__lte=date_to)
+            resources = resources.filter(created_at__lt=start_of_day(date_to + timedelta(days=1)))
+
+        if sort == 'popular':
+            resources = resources.popular()
+            ordering = POPULAR_ORDERING
+
+    return resources, ordering
+
 
-    paginator = Paginator(resources, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+def resource_list(request):
+    form = SearchForm(request.GET or None)
+    resources, ordering = filter_resources(form)
+
+    paginator = KeysetPaginator(resources, RESOURCES_PER_PAGE, ordering=ordering)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     context = {
         'page_obj': page_obj,
         'form': form,
         'search_query': request.GET.get('query', ''),
+        'querystring': _querystring_without_cursor(request),
     }
     return render(request, 'library/resource_list.html', context)
 
 
+def resource_permissions(user, resource):
+    if not user.is_authenticated:
+        return False, False
+    can_edit = user.role in ['teacher', 'admin'] or user.pk == resource.author_id
+    can_delete = user.role == 'admin' or user.pk == resource.author_id
+    return can_edit, can_delete
+
+
+def similar_links(resource):
+    # Списки готовит library/similar.py в фоне — здесь одна выборка по индексу (resource, rank)
+    return SimilarResource.objects.filter(resource=resource).select_related('similar').only(
+        'rank', 'similar__id', 'similar__title', 'similar__resource_type',
+    )[:SIMILAR_RESOURCES_SHOWN]
+
+
 def resource_detail(request, pk):
-    resource = get_object_or_404(Resource, pk=pk)
+    resource = get_object_or_404(Resource.objects.select_related('author'), pk=pk)
     user_rating = None
     is_bookmarked = False
 
@@ -89,12 +142,8 @@ def resource_detail(request, pk):
             user=request.user
         ).exists()
 
-    can_edit = False
-    can_delete = False
-
-    if request.user.is_authenticated:
-        can_edit = (request.user.role in ['teacher', 'admin'] or request.user == resource.author)
-        can_delete = (request.user.role == 'admin' or request.user == resource.author)
+    can_edit, can_delete = resource_permissions(request.user, resource)
+    similar_resources = [link.similar for link in similar_links(resource)]
 
     if request.method == 'POST' and request.user.is_authenticated:
         rating_form = RatingForm(request.POST)
@@ -116,9 +165,41 @@ def resource_detail(request, pk):
         'rating_form': rating_form,
         'can_edit': can_edit,
         'can_delete': can_delete,
+        'similar_resources': similar_resources,
+        # Автор каждого отзыва — тем же запросом, иначе review_card.html делает запрос на отзыв
+        'reviews': resource.ratings.select_related('user'),
     }
     return render(request, 'library/resource_detail.html', context)
 
+@login_required
+def resource_file(request, pk):
+    resource = get_object_or_404(Resource.objects.only('pk', 'title', 'file'), pk=pk)
+    if not resource.file:
+        raise Http404('У материала нет файла')
+
+    # Имя в хранилище — хеш содержимого, пользователю отдаем название материала
+    extension = os.path.splitext(resource.file.name)[1]
+    filename = f'{slugify(resource.title, allow_unicode=True) or "resource"}{extension}'
+    return media.serve_file(
+        request,
+        resource.file.storage,
+        resource.file.name,
+        filename=filename,
+        as_attachment=request.GET.get('download') == '1',
+    )
+
+@login_required
+def thumbnail(request, name):
+    # Превью показывают защищенные файлы материалов, поэтому доступны, как и resource_file,
+    # только после входа. Имя сверяется с форматом thumbnail_name() целиком: иначе
+    # thumbs/../resources/... отдал бы любой файл из MEDIA_ROOT
+    if not thumbnails.is_thumbnail_name(name):
+        raise Http404('Превью не найдено')
+    # Имя превью выводится из имени исходника, а при замене файла меняется и оно
+    return media.serve_file(
+        request, default_storage, name, cache_control='private, max-age=31536000, immutable'
+    )
+
 @login_required
 def add_resource(request):
     if request.user.role not in ['teacher', 'admin']:
@@ -149,28 +230,33 @@ def add_resource(request):
     }
     return render(request, 'library/resource_form.html', context)
 
+def _toggle_bookmark(user, resource_id):
+    # Удаление и создание без чтения: повторный клик или гонка двух вкладок
+    # не оставят дубликат (unique_together) и не уронят запрос
+    with transaction.atomic():
+        deleted, _ = Bookmark.objects.filter(user=user, resource_id=resource_id).delete()
+        if deleted:
+            return False
+        Bookmark.objects.get_or_create(user=user, resource_id=resource_id)
+        return True
+
+
 @login_required
 def bookmark_toggle(request, pk):
     resource = get_object_or_404(Resource, pk=pk)
 
-    bookmark, created = Bookmark.objects.get_or_create(
-        user=request.user,
-        resource=resource
-    )
-
-    if not created:
-        bookmark.delete()
-        messages.success(request, 'Удалено из избранного')
-    else:
+    if _toggle_bookmark(request.user, resource.pk):
         messages.success(request, 'Добавлено в избранное')
+    else:
+        messages.success(request, 'Удалено из избранного')
 
     return redirect(request.META.get('HTTP_REFERER', 'home'))
 
 @login_required
 def profile(request):
-    user_resources = Resource.objects.filter(author=request.user)
-    user_bookmarks = Bookmark.objects.filter(user=request.user)
-    user_ratings = Rating.objects.filter(user=request.user)
+    user_resources = Resource.objects.for_cards().filter(author=request.user)
+    user_bookmarks = Bookmark.objects.filter(user=request.user).select_related('resource')
+    user_ratings = Rating.objects.filter(user=request.user).select_related('resource')
 
     context = {
         'user_resources': user_resources,
@@ -199,28 +285,27 @@ def manage_topics(request):
 
 def topic_detail(request, pk):
     topic = get_object_or_404(Topic, pk=pk)
-    resources = Resource.objects.filter(topics=topic)
+    resources = Resource.objects.for_cards().filter(topics=topic)
+    page_obj = KeysetPaginator(resources, RESOURCES_PER_PAGE).get_page(request.GET.get('cursor'))
 
     all_topics = Topic.objects.exclude(pk=pk).annotate(
         resource_count=Count('resource')
     ).order_by('-resource_count')[:6]
 
-    video_count = resources.filter(resource_type='video').count()
-    pdf_count = resources.filter(resource_type='pdf').count()
-    link_count = resources.filter(resource_type='link').count()
-    note_count = resources.filter(resource_type='note').count()
-
-    unique_authors = resources.values('author').distinct().count()
+    topic_stats = get_topic_stats(topic.pk)
 
     context = {
         'topic': topic,
         'resources': resources,
+        'page_obj': page_obj,
+        'querystring': _querystring_without_cursor(request),
         'all_topics': all_topics,
-        'video_count': video_count,
-        'pdf_count': pdf_count,
-        'link_count': link_count,
-        'note_count': note_count,
-        'unique_authors': unique_authors,
+        'topic_stats': topic_stats,
+        'video_count': topic_stats.count_by_type('video'),
+        'pdf_count': topic_stats.count_by_type('pdf'),
+        'link_count': topic_stats.count_by_type('link'),
+        'note_count': topic_stats.count_by_type('note'),
+        'unique_authors': topic_stats.authors,
     }
     return render(request, 'library/topic_detail.html', context)
 
@@ -236,8 +321,9 @@ def edit_resource(request, pk):
         form = ResourceForm(request.POST, request.FILES, instance=resource)
         if form.is_valid():
             if 'clear_file' in request.POST and request.POST['clear_file'] == 'on':
-                if resource.file:
-                    resource.file.delete(save=False)
+                # Сам файл может быть общим с другими материалами: его удалит
+                # сигнал post_save, если эта ссылка была последней
+                form.instance.file = None
 
             if request.user.role != 'admin' and 'author' in form.changed_data:
                 messages.error(request, 'Вы не можете изменять автора материала')
@@ -299,6 +385,53 @@ def delete_resource_ajax(request, pk):
     return JsonResponse({'success': False, 'error': 'Неверный запрос'})
 
 
+@login_required
+@require_http_methods(["POST"])
+def bookmark_toggle_ajax(request, pk):
+    if not Resource.objects.filter(pk=pk).exists():
+        return JsonResponse({'success': False, 'error': 'Материал не найден'}, status=404)
+
+    bookmarked = _toggle_bookmark(request.user, pk)
+    return JsonResponse({
+        'success': True,
+        'resource_id': pk,
+        'bookmarked': bookmarked,
+        'bookmark_count': Bookmark.objects.filter(resource_id=pk).count(),
+    })
+
+
+@login_required
+@require_http_methods(["POST"])
+def rate_resource_ajax(request, pk):
+    resource = get_object_or_404(Resource.objects.only('pk', 'author_id'), pk=pk)
+    form = RatingForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'success': False, 'error': 'Проверьте оценку', 'errors': form.errors}, status=400)
+
+    rating, created = Rating.objects.update_or_create(
+        resource=resource,
+        user=request.user,
+        defaults=form.cleaned_data
+    )
+    # Агрегаты уже пересчитаны в Rating.save() одним UPDATE — читаем их обратно
+    aggregates = Resource.objects.values('rating_count', 'rating_avg').get(pk=pk)
+    review_html = render_to_string(
+        'library/review_card.html',
+        {'rating': rating, 'resource': resource, 'user': request.user},
+        request=request,
+    )
+    return JsonResponse({
+        'success': True,
+        'created': created,
+        'review_id': rating.pk,
+        'rating': rating.rating,
+        'comment': rating.comment,
+        'rating_count': aggregates['rating_count'],
+        'rating_avg': round(aggregates['rating_avg'], 1),
+        'review_html': review_html,
+    })
+
+
 @login_required
 def edit_review(request, pk):
     rating = get_object_or_404(Rating, pk=pk)
@@ -348,6 +481,42 @@ def topic_list(request):
     }
     return render(request, 'library/topic_list.html', context)
 
+@login_required
+@user_passes_test(is_staff_user)
+def export_resources(request):
+    fmt = request.GET.get('format', 'jsonl')
+    if fmt not in export.FORMATS:
+        return JsonResponse({'success': False, 'error': 'Неизвестный формат выгрузки'}, status=400)
+    compress = request.GET.get('gzip') == '1'
+
+    # Те же фильтры, что и в каталоге: можно выгрузить результаты поиска
+    resources, _ = filter_resources(SearchForm(request.GET or None))
+    stream = export.stream_export(export.export_queryset(resources), fmt, compress)
+
+    filename = export.export_filename(fmt, compress, timezone.localdate())
+    response = StreamingHttpResponse(
+        stream,
+        content_type='application/gzip' if compress else export.CONTENT_TYPES[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    return response
+
+@login_required
+@user_passes_test(is_staff_user)
+@require_http_methods(["POST"])
+def import_resources(request):
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'success': False, 'error': 'Файл не передан'}, status=400)
+    fmt = request.POST.get('format') or ('csv' if upload.name.endswith('.csv') else 'jsonl')
+    if fmt not in importer.FORMATS:
+        return JsonResponse({'success': False, 'error': 'Неизвестный формат импорта'}, status=400)
+
+    pipeline = importer.ResourceImporter(request.user, create_topics=request.POST.get('create_topics') != '0')
+    report = pipeline.run(importer.read_rows(upload, fmt))
+    return JsonResponse({'success': True, **report.as_dict()})
+
 @login_required
 @user_passes_test(is_staff_user)
 def add_topic(request):
@@ -517,6 +686,7 @@ def revoke_registration_key(request, key_id):
         }, status=500)
 
 @csrf_exempt
+@ratelimit('register', '5/m', burst=10, json=True)
 def register_with_key(request):
     if request.method == 'POST':
         try:
@@ -526,6 +696,8 @@ def register_with_key(request):
             email = data.get('email')
             password = data.get('password')
 
+            from accounts.models import RegistrationKey
+
             try:
                 key = RegistrationKey.objects.get(key=registration_key)
             except RegistrationKey.DoesNotExist:
@@ -555,21 +727,24 @@ def register_with_key(request):
                     'error': 'Пользователь с таким email уже существует'
                 }, status=400)
 
-            user = User.objects.create_user(
-                username=username,
-                email=email,
-                password=password
-            )
-
-            if key.role == RegistrationKey.ROLE_ADMIN:
+            user = User(username=username, email=email, role=key.role)
+            # Хешируем пароль до транзакции, чтобы не держать блокировку на запись
+            user.set_password(password)
+            if key.role == 'admin':
                 user.is_superuser = True
                 user.is_staff = True
-            elif key.role == RegistrationKey.ROLE_EDITOR:
+            elif key.role == 'teacher':
                 user.is_staff = True
 
-            user.save()
-
-            key.use_key()
+            with transaction.atomic():
+                # Проверка is_valid() выше — только для понятного сообщения; засчитывает
+                # использование условный UPDATE, и без него пользователь не создается
+                if not RegistrationKey.objects.consume(key.key):
+                    return JsonResponse({
+                        'success': False,
+                        'error': 'Ключ использован максимальное число раз'
+                    }, status=400)
+                user.save()
 
             login(request, user)
 
@@ -0,0 +1,37 @@
+import os
+import signal
+import threading
+import time
+
+
+def main(index, stop, poll_interval, max_jobs):
+    """Точка входа процесса-обработчика очереди (manage.py run_jobs).
+
+    Модуль не импортирует модели на верхнем уровне: при запуске через spawn
+    (Windows, macOS) процесс начинает с чистого интерпретатора и сначала
+    должен выполнить django.setup().
+    """
+    import django
+    from django.db import connections
+
+    django.setup()
+    # Ctrl+C получает вся группа процессов; останавливает обработчиков родитель через stop,
+    # чтобы текущая задача успела завершиться
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # После fork соединение родителя использовать нельзя
+    connections.close_all()
+
+    parent = os.getppid()
+
+    def watch_parent():
+        # Родителя убили без SIGTERM (kill -9) — не оставляем осиротевших обработчиков
+        while not stop.is_set():
+            if os.getppid() != parent:
+                stop.set()
+            time.sleep(poll_interval)
+
+    threading.Thread(target=watch_parent, daemon=True).start()
+
+    from . import jobs
+    jobs.work(index, stop, poll_interval=poll_interval, max_jobs=max_jobs)